@@ -6,13 +6,15 @@ import declarative
 import textwrap
 import re
 import os
+import __builtin__
 try:
     from pkg_resources import resource_filename
 except ImportError:
     resource_filename = None
 
-__all__ = ['NoDefault', 'Invalid', 'Validator', 'Identity',
-           'FancyValidator', 'is_validator']
+__all__ = ['NoDefault', 'Invalid', 'ErrorRecord', 'SparseErrorList',
+           'Result', 'Validator', 'Identity', 'FancyValidator',
+           'is_validator', 'bind_translator']
 
 import gettext
 
@@ -58,6 +60,30 @@ def set_stdtranslation(domain="FormEncode", languages=None, \
 
 set_stdtranslation()
 
+# Translated message templates, keyed by (translator, message name,
+# validator class, gettext args) -- or the template itself instead of
+# the class, for validators given their own messages; cleared
+# whenever it grows past translation_cache_size:
+_translation_cache = {}
+translation_cache_size = 1000
+
+def bind_translator(state, translator=None):
+    """
+    Stores the translation function on ``state`` (as ``state._``, which
+    is where validators look first), so it is resolved once instead of
+    for every message.  If ``translator`` isn't given and ``state``
+    doesn't already have one, the builtin ``_`` or the standard
+    FormEncode translation is used.  Returns ``state``.
+    """
+    if translator is None:
+        translator = getattr(state, '_', None)
+    if not callable(translator):
+        translator = getattr(__builtin__, '_', None)
+    if not callable(translator):
+        translator = _stdtrans
+    state._ = translator
+    return state
+
 def _(s): return s # dummy i18n translation function, nothing is translated here.
                    # Instead this is actually done in api.Validator.message.
                    # The surrounding _("string") of the strings is only for extracting
@@ -72,6 +98,35 @@ def is_validator(obj):
             (isinstance(obj, type) and
              issubclass(obj, Validator)))
 
+class LazyMessage(object):
+
+    """
+    A message that is only rendered (by calling ``func(*args,
+    **kw)``) the first time it is needed.  `Invalid` accepts one of
+    these as its message, which saves formatting text nobody reads --
+    e.g., when the caller only looks at ``error_dict`` or
+    ``unpack_errors()``.  See also `Validator.lazy_message`.
+    """
+
+    def __init__(self, func, *args, **kw):
+        self.func = func
+        self.args = args
+        self.kw = kw
+
+    def render(self):
+        return self.func(*self.args, **self.kw)
+
+    def __str__(self):
+        return str(self.render())
+
+    def __unicode__(self):
+        return unicode(self.render())
+
+    def __repr__(self):
+        return '<%s %s%r>' % (self.__class__.__name__,
+                              getattr(self.func, '__name__', self.func),
+                              self.args)
+
 class Invalid(Exception):
 
     """
@@ -80,7 +135,9 @@ class Invalid(Exception):
 
     msg:
         The message, *without* values substituted.  For instance, if
-        you want HTML quoting of values, you can apply that.
+        you want HTML quoting of values, you can apply that.  If the
+        exception was created with a `LazyMessage`, it is rendered
+        the first time this is accessed.
     substituteArgs:
         The arguments (a dictionary) to go with `msg`.
     str(self):
@@ -95,6 +152,7 @@ class Invalid(Exception):
         and sub-validator(s) had errors, then this is a list of those
         exceptions.  The list will be the same length as the number of
         values -- valid values will have None instead of an exception.
+        It may be a `SparseErrorList`, which acts the same way.
     error_dict:
         Like `error_list`, but for dictionary compound validators.
     """
@@ -102,7 +160,7 @@ class Invalid(Exception):
     def __init__(self, msg,
                  value, state, error_list=None, error_dict=None):
         Exception.__init__(self, msg)
-        self.msg = msg
+        self._msg = msg
         self.value = value
         self.state = state
         self.error_list = error_list
@@ -112,6 +170,49 @@ class Invalid(Exception):
                 "(error %s has %s and %s)"
                 % (self, self.error_list, self.error_dict))
 
+    def msg__get(self):
+        msg = self._msg
+        if isinstance(msg, LazyMessage):
+            msg = self._msg = msg.render()
+            args = BaseException.args.__get__(self)
+            if args and args[0] is not msg:
+                BaseException.args.__set__(self, (msg,) + args[1:])
+        return msg
+
+    def msg__set(self, value):
+        self._msg = value
+
+    msg = property(msg__get, msg__set)
+
+    # A lazy message is rendered when any of these is read too:
+
+    message = msg
+
+    def args__get(self):
+        self.msg
+        return BaseException.args.__get__(self)
+
+    def args__set(self, value):
+        BaseException.args.__set__(self, value)
+
+    args = property(args__get, args__set)
+
+    def __getitem__(self, index):
+        return self.args[index]
+
+    def __getslice__(self, start, stop):
+        return self.args[start:stop]
+
+    def __repr__(self):
+        return '%s%r' % (self.__class__.__name__, self.args)
+
+    def __reduce__(self):
+        # The state is application-specific and often can't be
+        # pickled, and a lazy message refers back to its validator,
+        # so neither is kept:
+        return (self.__class__, (self.msg, self.value, None,
+                                 self.error_list, self.error_dict))
+
     def __str__(self):
         val = self.msg
         #if self.value:
@@ -127,32 +228,44 @@ class Invalid(Exception):
             return unicode(self.msg)
 
     def unpack_errors(self, encode_variables=False, dict_char='.',
-                      list_char='-'):
+                      list_char='-', sparse=False):
         """
         Returns the error as a simple data structure -- lists,
         dictionaries, and strings.
         
         If ``encode_variables`` is true, then this will return a flat
         dictionary, encoded with variable_encode
+
+        If ``sparse`` is true, a `SparseErrorList` is unpacked into
+        another `SparseErrorList` instead of a list.
         """
         if self.error_list:
             assert not encode_variables, (
                 "You can only encode dictionary errors")
             assert not self.error_dict
+            if isinstance(self.error_list, SparseErrorList):
+                result = SparseErrorList(length=len(self.error_list))
+                for index, item in self.error_list.by_index.items():
+                    result.by_index[index] = _unpack_child(item, sparse)
+                if not sparse:
+                    result = result.dense()
+                return result
             result = []
             for item in self.error_list:
                 if not item:
                     result.append(item)
                 else:
-                    result.append(item.unpack_errors())
+                    result.append(_unpack_child(item, sparse))
             return result
         elif self.error_dict:
             result = {}
+            # variable_encode skips the valid items of sparse lists:
+            sparse = sparse or encode_variables
             for name, item in self.error_dict.items():
                 if isinstance(item, (str, unicode)):
                     result[name] = item
                 else:
-                    result[name] = item.unpack_errors()
+                    result[name] = _unpack_child(item, sparse)
             if encode_variables:
                 import variabledecode
                 result = variabledecode.variable_encode(result, add_repetitions=False,
@@ -167,11 +280,300 @@ class Invalid(Exception):
                 "You can only encode dictionary errors")
             return self.msg
 
+    def compact(self, keep_value=False, keep_state=False):
+        """
+        Returns a copy of this error that takes as little memory as
+        possible, for keeping lots of errors around (e.g., when
+        validating in bulk): the message is rendered, the value and
+        state are dropped unless ``keep_value`` or ``keep_state`` are
+        true, and the errors in ``error_list`` and ``error_dict`` are
+        turned into `ErrorRecord` objects.  The copy is still an
+        `Invalid`.
+        """
+        return Invalid(*_compact_args(self, keep_value, keep_state))
+
+def _unpack_child(error, sparse):
+    if (type(error) is Invalid and not error.error_list
+        and not error.error_dict):
+        # The common case; a plain error unpacks to its message:
+        return error.msg
+    # Errors from elsewhere may have an unpack_errors() that doesn't
+    # take sparse, so it's only passed when it matters:
+    if sparse:
+        return error.unpack_errors(sparse=True)
+    return error.unpack_errors()
+
+def _compact_args(error, keep_value, keep_state):
+    value = state = None
+    if keep_value:
+        value = error.value
+    if keep_state:
+        state = error.state
+    error_list, error_dict = _compact_children(error, keep_value, keep_state)
+    return (error.msg, value, state, error_list, error_dict)
+
+def _compact_children(error, keep_value, keep_state):
+    error_list = error_dict = None
+    if isinstance(error.error_list, SparseErrorList):
+        error_list = SparseErrorList(length=len(error.error_list))
+        for index, item in error.error_list.by_index.items():
+            error_list.by_index[index] = _compact_record(
+                item, keep_value, keep_state)
+    elif error.error_list:
+        error_list = []
+        for item in error.error_list:
+            if item is not None:
+                item = _compact_record(item, keep_value, keep_state)
+            error_list.append(item)
+    elif error.error_dict:
+        error_dict = {}
+        for name, item in error.error_dict.items():
+            if not isinstance(item, (str, unicode)):
+                item = _compact_record(item, keep_value, keep_state)
+            error_dict[name] = item
+    return error_list, error_dict
+
+def _reissue(error, value, state):
+    """
+    A new `Invalid` for ``value`` and ``state`` from ``error``, a
+    compacted error kept in a cache: each caller gets its own error
+    and containers of child errors, so nothing one caller does to
+    them reaches the others (the `ErrorRecord` children are read-only,
+    and are shared).
+    """
+    error_list = error.error_list
+    if isinstance(error_list, SparseErrorList):
+        error_list = SparseErrorList(error_list.by_index.copy(),
+                                     error_list.length)
+    elif error_list:
+        error_list = list(error_list)
+    error_dict = error.error_dict
+    if error_dict:
+        error_dict = error_dict.copy()
+    return Invalid(error.msg, value, state, error_list, error_dict)
+
+def _compact_record(error, keep_value, keep_state):
+    if isinstance(error, ErrorRecord):
+        return error
+    return ErrorRecord(*_compact_args(error, keep_value, keep_state))
+
+class ErrorRecord(object):
+
+    """
+    A compact, read-only stand-in for an `Invalid` inside another
+    error's ``error_list`` or ``error_dict`` (see `Invalid.compact`).
+    It has the same attributes, ``str()`` and ``.unpack_errors()``,
+    but isn't an exception, and has no traceback or arguments.  Use
+    ``.invalid()`` to get an `Invalid` back.
+    """
+
+    __slots__ = ('msg', 'value', 'state', 'error_list', 'error_dict')
+
+    def __init__(self, msg, value=None, state=None, error_list=None,
+                 error_dict=None):
+        self.msg = msg
+        self.value = value
+        self.state = state
+        self.error_list = error_list
+        self.error_dict = error_dict
+
+    def __reduce__(self):
+        return (self.__class__, (self.msg, self.value, None,
+                                 self.error_list, self.error_dict))
+
+    __str__ = Invalid.__str__.im_func
+    __unicode__ = Invalid.__unicode__.im_func
+    unpack_errors = Invalid.unpack_errors.im_func
+
+    def compact(self, keep_value=False, keep_state=False):
+        return self
+
+    def invalid(self):
+        """
+        Returns this error as an `Invalid`.
+        """
+        return Invalid(self.msg, self.value, self.state,
+                       self.error_list, self.error_dict)
+
+    def __repr__(self):
+        return '<%s %r>' % (self.__class__.__name__, self.msg)
+
+class SparseErrorList(object):
+
+    """
+    An ``error_list`` that only stores the errors: ``by_index`` maps
+    the positions of the invalid items to their errors, and
+    ``length`` is the number of items.  It acts like the equivalent
+    list, with None for the valid items -- it can be indexed,
+    iterated, appended to and compared with lists -- but its size
+    depends on the number of errors, not of items::
+
+        >>> errors = SparseErrorList({2: 'bad'}, 4)
+        >>> len(errors), errors[2], errors[-1]
+        (4, 'bad', None)
+        >>> errors == [None, None, 'bad', None]
+        True
+        >>> errors.items()
+        [(2, 'bad')]
+
+    Iterating walks every position; ``.items()`` only the errors.
+    """
+
+    __slots__ = ('by_index', 'length')
+
+    def __init__(self, by_index=None, length=0):
+        if by_index is None:
+            by_index = {}
+        self.by_index = by_index
+        self.length = length
+
+    def from_list(cls, errors):
+        """
+        Makes a `SparseErrorList` out of a list of errors and Nones.
+        """
+        if isinstance(errors, cls):
+            return errors
+        by_index = {}
+        for index, error in enumerate(errors):
+            if error is not None:
+                by_index[index] = error
+        return cls(by_index, len(errors))
+
+    from_list = classmethod(from_list)
+
+    def items(self):
+        """
+        The ``(index, error)`` pairs, in order.
+        """
+        items = self.by_index.items()
+        items.sort()
+        return items
+
+    def dense(self):
+        """
+        The equivalent list.
+        """
+        result = [None] * self.length
+        for index, error in self.by_index.items():
+            result[index] = error
+        return result
+
+    def append(self, error):
+        if error is not None:
+            self.by_index[self.length] = error
+        self.length += 1
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(self.length))]
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError("list index out of range")
+        return self.by_index.get(index)
+
+    def __iter__(self):
+        get = self.by_index.get
+        for index in xrange(self.length):
+            yield get(index)
+
+    def __eq__(self, other):
+        if isinstance(other, SparseErrorList):
+            return (self.length == other.length
+                    and self.by_index == other.by_index)
+        if isinstance(other, (list, tuple)):
+            return (self.length == len(other)
+                    and self == SparseErrorList.from_list(other))
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __reduce__(self):
+        return (self.__class__, (self.by_index, self.length))
+
+    def __repr__(self):
+        return '%s(%r, %i)' % (self.__class__.__name__, self.by_index,
+                               self.length)
+
 
 ############################################################
 ## Base Classes
 ############################################################
 
+class Result(object):
+
+    """
+    What `Validator.validate()` returns: ``value`` is the converted
+    value, and ``errors`` is None, or -- if the value was invalid --
+    the `Invalid` exception (which hasn't been raised) describing
+    why.  In that case ``value`` is the value that was being
+    converted.
+
+    ``.unwrap()`` gets you back to the ``.to_python()`` behavior.
+
+    ``memo`` is for validators that can reuse parts of an earlier
+    result (see `Schema.revalidate`); it isn't pickled.
+    """
+
+    __slots__ = ('value', 'errors', 'memo')
+
+    def __init__(self, value, errors=None):
+        self.value = value
+        self.errors = errors
+        self.memo = None
+
+    def __getstate__(self):
+        return (self.value, self.errors)
+
+    def __setstate__(self, state):
+        self.value, self.errors = state
+        self.memo = None
+
+    def unwrap(self):
+        """
+        Returns the value, or raises the error.
+        """
+        if self.errors is not None:
+            raise self.errors
+        return self.value
+
+    def __repr__(self):
+        if self.errors is None:
+            return '<Result %r>' % (self.value,)
+        return '<Result %r errors=%r>' % (self.value, self.errors)
+
+def _cost_of(validator):
+    """
+    The ``cost`` of a validator (or validator class).
+    """
+    if isinstance(validator, type):
+        validator = validator.singleton()
+    return getattr(validator, 'cost', 1)
+
+def _pure_of(validator):
+    """
+    Whether a validator (or validator class) is ``pure``.
+    """
+    if isinstance(validator, type):
+        validator = validator.singleton()
+    return getattr(validator, 'pure', False)
+
+def _validate_to_python(validator, value, state):
+    """
+    Implements ``.validate()`` in terms of ``.to_python()``.
+    """
+    try:
+        return Result(validator.to_python(value, state))
+    except Invalid, e:
+        return Result(value, e)
+
 class Validator(declarative.Declarative):
 
     """
@@ -186,9 +588,22 @@ class Validator(declarative.Declarative):
     gettextargs = {}
     use_builtins_gettext = True #In case you dont want to use __builtins__._
                                 #altough it may be definied, set this to False
+    # Set to True to cache translated messages by translation
+    # function; only do this if your translation function always
+    # gives the same result for the same message (e.g., it doesn't
+    # switch language internally):
+    cache_translations = False
+    # How expensive this validator is, relative to a simple check
+    # (1).  Schema validates cheaper fields first, and can skip
+    # expensive ones (see Schema.skip_expensive_on_error):
+    cost = 1
+    # True if the result only depends on the value being validated
+    # (not the state, the time, ...), so it can be cached (see
+    # compound.Memoize):
+    pure = False
     
-    __singletonmethods__ = ('to_python', 'from_python', 'message', 'all_messages',
-                            'subvalidators')
+    __singletonmethods__ = ('to_python', 'from_python', 'validate', 'message',
+                            'all_messages', 'subvalidators')
 
     def __classinit__(cls, new_attrs):
         if new_attrs.has_key('messages'):
@@ -210,28 +625,43 @@ class Validator(declarative.Declarative):
     def from_python(self, value, state=None):
         return value
 
-    def message(self, msgName, state, **kw):
-        #determine translation function
-        try:
-            trans = state._
-        except AttributeError:
-            try:
-                if self.use_builtins_gettext:
-                    import __builtin__
-                    trans = __builtin__._
-                    
-                else:
-                    trans = _stdtrans
- 
-            except AttributeError:
-                trans = _stdtrans
- 
-        if not callable(trans):
-            trans = _stdtrans
-
+    def validate(self, value, state=None):
+        """
+        Like ``.to_python()``, but returns a `Result` instead of
+        raising `Invalid`.  This implementation just catches the
+        exception; `FancyValidator` and the compound validators pass
+        errors back without raising them at all.
+        """
+        return _validate_to_python(self, value, state)
 
+    def message(self, msgName, state, **kw):
+        trans = self.get_translator(state)
         msg = self._messages[msgName]
-        msg = trans(msg, **self.gettextargs)
+        if self.cache_translations:
+            owner = self.__class__
+            if self._messages is not owner._messages:
+                # Messages given to this instance; its class doesn't
+                # tell which template this is:
+                owner = msg
+            if self.gettextargs:
+                args = self.gettextargs.items()
+                args.sort()
+                key = (trans, msgName, owner, tuple(args))
+            else:
+                key = (trans, msgName, owner)
+            try:
+                translated = _translation_cache[key]
+            except KeyError:
+                translated = trans(msg, **self.gettextargs)
+                if len(_translation_cache) >= translation_cache_size:
+                    _translation_cache.clear()
+                _translation_cache[key] = translated
+            except TypeError:
+                # Unhashable translator or arguments
+                translated = trans(msg, **self.gettextargs)
+            msg = translated
+        else:
+            msg = trans(msg, **self.gettextargs)
         try:
             return msg % kw
         except KeyError, e:
@@ -240,6 +670,23 @@ class Validator(declarative.Declarative):
                 % (e, msgName, self._messages.get(msgName), kw,
                    ', '.join(self._messages.keys())))
 
+    def get_translator(self, state):
+        """
+        Returns the translation function to use for messages: ``state._``
+        if present (see `bind_translator`), otherwise the builtin ``_``
+        (if ``use_builtins_gettext`` is true), otherwise the standard
+        FormEncode translation.
+        """
+        trans = getattr(state, '_', NoDefault)
+        if trans is NoDefault:
+            if self.use_builtins_gettext:
+                trans = getattr(__builtin__, '_', _stdtrans)
+            else:
+                trans = _stdtrans
+        if not callable(trans):
+            trans = _stdtrans
+        return trans
+
     def all_messages(self):
         """
         Return a dictionary of all the messages of this validator, and
@@ -268,6 +715,13 @@ class Validator(declarative.Declarative):
                     msgs[key] = msg
         return msgs
 
+    def lazy_message(self, msgName, state, **kw):
+        """
+        Like ``.message()``, but returns a `LazyMessage` that is only
+        rendered if someone reads it.
+        """
+        return LazyMessage(self.message, msgName, state, **kw)
+
     def subvalidators(self):
         """
         Return any validators that this validator contains.  This is
@@ -300,6 +754,60 @@ class _Identity(Validator):
         return 'validators.Identity'
 Identity = _Identity()
 
+# The optional stages of FancyValidator, and the flag that records
+# whether each one is active:
+_stage_methods = {
+    'validate_other': '_has_validate_other',
+    '_to_python': '_has_to_python',
+    'validate_python': '_has_validate_python',
+    '_from_python': '_has_from_python',
+    }
+
+# Methods that return a `Result` instead of raising `Invalid`, the
+# flag that records whether each one can be used, and the methods it
+# stands in for.  A subclass that overrides one of those (but not the
+# native method) gets the exception-catching path instead:
+_result_methods = {
+    'validate': ('_has_native_validate', ('to_python',)),
+    '_to_python_result': ('_has_native_to_python',
+                          ('_to_python', 'attempt_convert')),
+    }
+
+_stage_attributes = {}
+for _name, (_flag, _shadows) in _result_methods.items():
+    _stage_attributes[_name] = None
+    for _shadow in _shadows:
+        _stage_attributes[_shadow] = None
+_stage_attributes.update(_stage_methods)
+del _name, _flag, _shadows, _shadow
+
+def _native_method(obj, name, shadows):
+    """
+    True if ``obj`` gets ``name`` from no further up than any of the
+    methods in ``shadows`` (looking at the instance dictionary and
+    then the MRO), and it isn't None.
+    """
+    if isinstance(obj, type):
+        cls = obj
+        dicts = []
+    else:
+        cls = obj.__class__
+        dicts = [obj.__dict__]
+    dicts.extend([c.__dict__ for c in cls.__mro__])
+    for d in dicts:
+        if name in d:
+            return d[name] is not None
+        for shadow in shadows:
+            if shadow in d:
+                return False
+    return False
+
+def _validate_noop(self, value, state):
+    """
+    A validation method that doesn't do anything.
+    """
+    pass
+
 class FancyValidator(Validator):
 
     """
@@ -318,6 +826,10 @@ class FancyValidator(Validator):
     * .from_python(value, state):
       Reverses to_python.
 
+    There is also ``.validate(value, state)``, which does what
+    ``.to_python()`` does but returns a `Result` holding the value or
+    the (unraised) Invalid exception.
+
     There are five important methods for subclasses to override,
     however none of these *have* to be overridden, only the ones that
     are appropriate for the validator:
@@ -390,30 +902,43 @@ class FancyValidator(Validator):
         'noneType': _("The input must be a string (not None)"),
         }
 
+    def __classinit__(cls, new_attrs):
+        Validator.__classinit__(cls, new_attrs)
+        cls._initialize_stages()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name in _stage_attributes:
+            self._initialize_stages()
+
+    def __delattr__(self, name):
+        object.__delattr__(self, name)
+        if name in _stage_attributes:
+            self._initialize_stages()
+
     def to_python(self, value, state=None):
         try:
-            if self.strip and isinstance(value, (str, unicode)):
-                value = value.strip()
+            if isinstance(value, basestring):
+                if self.strip:
+                    value = value.strip()
             elif hasattr(value, 'mixed'):
                 # Support Paste's MultiDict
                 value = value.mixed()
             if self.is_empty(value):
                 if self.not_empty:
-                    raise Invalid(self.message('empty', state), value, state)
+                    raise Invalid(self.lazy_message('empty', state),
+                                  value, state)
                 else:
                     if self.if_empty is not NoDefault:
                         return self.if_empty
                     else:
                         return self.empty_value(value)
-            vo = self.validate_other
-            if vo and vo is not self._validate_noop:
-                vo(value, state)
-            tp = self._to_python
-            if tp:
-                value = tp(value, state)
-            vp = self.validate_python
-            if vp and vp is not self._validate_noop:
-                vp(value, state)
+            if self._has_validate_other:
+                self.validate_other(value, state)
+            if self._has_to_python:
+                value = self._to_python(value, state)
+            if self._has_validate_python:
+                self.validate_python(value, state)
             return value
         except Invalid:
             if self.if_invalid is NoDefault:
@@ -421,32 +946,71 @@ class FancyValidator(Validator):
             else:
                 return self.if_invalid
 
+    def validate(self, value, state=None):
+        if not self._has_native_validate:
+            return _validate_to_python(self, value, state)
+        if isinstance(value, basestring):
+            if self.strip:
+                value = value.strip()
+        elif hasattr(value, 'mixed'):
+            # Support Paste's MultiDict
+            value = value.mixed()
+        if self.is_empty(value):
+            if not self.not_empty:
+                if self.if_empty is not NoDefault:
+                    return Result(self.if_empty)
+                else:
+                    return Result(self.empty_value(value))
+            result = Result(value, Invalid(self.lazy_message('empty', state),
+                                           value, state))
+        else:
+            result = self._validate_stages(value, state)
+        if result.errors is not None and self.if_invalid is not NoDefault:
+            return Result(self.if_invalid)
+        return result
+
+    def _validate_stages(self, value, state):
+        try:
+            if self._has_validate_other:
+                self.validate_other(value, state)
+            if self._has_to_python and not self._has_native_to_python:
+                value = self._to_python(value, state)
+        except Invalid, e:
+            return Result(value, e)
+        if self._has_native_to_python:
+            result = self._to_python_result(value, state)
+            if result.errors is not None:
+                return result
+            value = result.value
+        if self._has_validate_python:
+            try:
+                self.validate_python(value, state)
+            except Invalid, e:
+                return Result(value, e)
+        return Result(value)
+
     def from_python(self, value, state=None):
         try:
-            if self.strip and isinstance(value, (str, unicode)):
+            if self.strip and isinstance(value, basestring):
                 value = value.strip()
             if not self.accept_python:
                 if self.is_empty(value):
                     if self.not_empty:
-                        raise Invalid(self.message('empty', state),
+                        raise Invalid(self.lazy_message('empty', state),
                                       value, state)
                     else:
                         return self.empty_value(value)
-                vp = self.validate_python
-                if vp and vp is not self._validate_noop:
-                    vp(value, state)
-                fp = self._from_python
-                if fp:
-                    value = fp(value, state)
-                vo = self.validate_other
-                if vo and vo is not self._validate_noop:
-                    vo(value, state)
+                if self._has_validate_python:
+                    self.validate_python(value, state)
+                if self._has_from_python:
+                    value = self._from_python(value, state)
+                if self._has_validate_other:
+                    self.validate_other(value, state)
                 return value
             else:
                 if self.is_empty(value):
                     return self.empty_value(value)
-                fp = self._from_python
-                if fp:
+                if self._has_from_python:
                     value = self._from_python(value, state)
                 return value
         except Invalid:
@@ -455,6 +1019,31 @@ class FancyValidator(Validator):
             else:
                 return self.if_invalid_python
 
+    def _initialize_stages(self, cls):
+        """
+        Works out which of ``validate_other``, ``_to_python``,
+        ``validate_python`` and ``_from_python`` actually do
+        something, so ``.to_python()`` and ``.from_python()`` can skip
+        the others, and whether ``.validate()`` can use the methods
+        that return a `Result`.  This runs for every class, and again
+        for an instance whenever one of these is assigned on it.
+        """
+        obj = self or cls
+        flags = {}
+        for name, flag in _stage_methods.items():
+            meth = getattr(obj, name, None)
+            flags[flag] = bool(meth) and (
+                getattr(meth, 'im_func', None) is not _validate_noop)
+        for name, (flag, shadows) in _result_methods.items():
+            flags[flag] = _native_method(obj, name, shadows)
+        for flag, active in flags.items():
+            if self is None:
+                setattr(cls, flag, active)
+            else:
+                object.__setattr__(self, flag, active)
+
+    _initialize_stages = declarative.classinstancemethod(_initialize_stages)
+
     def is_empty(self, value):
         # None and '' are "empty"
         return value is None or value == '' or (
@@ -465,8 +1054,8 @@ class FancyValidator(Validator):
 
     def assert_string(self, value, state):
         if not isinstance(value, (str, unicode)):
-            raise Invalid(self.message('badType', state,
-                                       type=type(value), value=value),
+            raise Invalid(self.lazy_message('badType', state,
+                                            type=type(value), value=value),
                           value, state)
 
     def base64encode(self, value):
@@ -476,13 +1065,11 @@ class FancyValidator(Validator):
         """
         return value.encode('base64').strip().replace('\n', '')
 
-    def _validate_noop(self, value, state):
-        """
-        A validation method that doesn't do anything.
-        """
-        pass
-    
+    _validate_noop = _validate_noop
+
     validate_python = validate_other = _validate_noop
     _to_python = None
+    _to_python_result = None
     _from_python = None
 
+
@@ -0,0 +1,521 @@
+"""
+Compiles validators (typically a `Schema`) into specialized Python
+functions.
+
+The interpreted validators do a fair amount of generic work on every
+call: looking up ``strip``, ``not_empty``, ``if_empty`` and friends,
+fetching ``validate_other`` and ``validate_python`` just to find out
+they are no-ops, and going through several method layers for every
+field.  This module walks a validator tree once and generates source
+code with all of that resolved, then ``exec``'s it::
+
+    >>> from formencode import Schema, validators
+    >>> from formencode.codegen import CompiledValidator
+    >>> class Signup(Schema):
+    ...     name = validators.String(not_empty=True, strip=True)
+    ...     age = validators.Int(if_missing=None)
+    >>> fast = CompiledValidator(Signup)
+    >>> fast.to_python({'name': ' Bob '}) == {'name': 'Bob', 'age': None}
+    True
+    >>> fast.to_python({'name': '', 'age': 'x'})
+    Traceback (most recent call last):
+        ...
+    Invalid: age: Please enter an integer value
+    name: Please enter a value
+
+Plain `FancyValidator` leaves have their ``.to_python()`` logic
+inlined, `Schema`, `All`, `Pipe` and `ForEach` are compiled
+structurally, and anything else (validators overriding
+``.to_python()``, `Any`, chained validators, schemas with fields of
+different ``cost``, expensive fields to skip, ``track_dependencies``
+or a ``result_cache``, ...) is called as usual.
+The results, and the `Invalid` errors, are identical to the
+interpreted validators.
+
+The compiled code takes a snapshot of the validators' settings, so
+compile again if you change them.  ``.from_python()`` is not compiled;
+it is passed through to the original validator.
+"""
+
+from api import NoDefault, Invalid, LazyMessage, Validator, FancyValidator
+from api import _stage_methods
+from schema import Schema, format_compound_error, merge_dicts
+from compound import CompoundValidator, All, Pipe
+from foreach import ForEach
+
+__all__ = ['CompiledValidator', 'compile_validator']
+
+def compile_validator(validator):
+    """
+    Returns a function ``to_python(value, state)`` that behaves like
+    ``validator.to_python``, and the source code generated for it.
+    """
+    compiler = ValidatorCompiler()
+    name = compiler.compile_function(validator)
+    return compiler.build(name)
+
+class CompiledValidator(Validator):
+
+    """
+    Wraps a validator with a compiled version of its ``.to_python()``.
+
+    ``.from_python()`` and ``if_missing`` are taken from the wrapped
+    validator, so this can be used anywhere the original validator
+    could, including as a field of another `Schema`.
+    """
+
+    validator = None
+    source = None
+
+    __unpackargs__ = ('validator',)
+
+    # Generated functions can't be pickled; they're compiled again
+    # when unpickling:
+    __transientattributes__ = ('_compiled', 'source')
+
+    def __initargs__(self, new_attrs):
+        if isinstance(self.validator, type):
+            self.validator = self.validator.singleton()
+        if not new_attrs.has_key('if_missing'):
+            self.if_missing = getattr(self.validator, 'if_missing',
+                                      NoDefault)
+        self._compiled, self.source = compile_validator(self.validator)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._compiled, self.source = compile_validator(self.validator)
+
+    def to_python(self, value, state=None):
+        return self._compiled(value, state)
+
+    def from_python(self, value, state=None):
+        return self.validator.from_python(value, state)
+
+    def subvalidators(self):
+        return [self.validator]
+
+############################################################
+## Code generation
+############################################################
+
+def _lookup(obj, name):
+    """
+    Finds the raw class attribute ``name`` of ``obj`` (without
+    triggering descriptors), or None if the instance overrides it.
+    """
+    if obj.__dict__.has_key(name):
+        return None
+    for base in type(obj).__mro__:
+        if base.__dict__.has_key(name):
+            return base.__dict__[name]
+    return None
+
+def _inherits(obj, name, owner):
+    return _lookup(obj, name) is owner.__dict__[name]
+
+def _active_method(obj, name):
+    """
+    Returns the bound method ``name`` of ``obj``, or None if that
+    stage is inactive (see ``FancyValidator._initialize_stages``).
+    """
+    if getattr(obj, _stage_methods[name]):
+        return getattr(obj, name)
+    return None
+
+class ValidatorCompiler(object):
+
+    """
+    Accumulates the generated source and the namespace it runs in.
+    Each validator compiles either into a function (`Schema`,
+    `ForEach` and the top-level validator) or into a block of
+    statements that converts one local variable into another.
+    """
+
+    def __init__(self):
+        self.namespace = {
+            'Invalid': Invalid,
+            'LazyMessage': LazyMessage,
+            'format_compound_error': format_compound_error,
+            'merge_dicts': merge_dicts,
+            'isinstance': isinstance,
+            'hasattr': hasattr,
+            'getattr': getattr,
+            'NoDefault': NoDefault,
+            }
+        self.functions = []
+        # Module-level assignments run after all the functions are
+        # defined (e.g., the field dispatch tables):
+        self.links = []
+        self.counter = 0
+        self.compiled = {}
+
+    def build(self, name):
+        source = '\n\n'.join(self.functions) + '\n\n'
+        source += ''.join([line + '\n' for line in self.links])
+        code = compile(source, '<formencode.codegen>', 'exec')
+        exec code in self.namespace
+        return self.namespace[name], source
+
+    def new_name(self, prefix):
+        self.counter += 1
+        return '%s_%i' % (prefix, self.counter)
+
+    def const(self, obj, prefix='c'):
+        name = self.new_name(prefix)
+        self.namespace[name] = obj
+        return name
+
+    def resolve(self, validator):
+        if isinstance(validator, type):
+            return validator.singleton()
+        return validator
+
+    def kind(self, validator):
+        if not isinstance(validator, FancyValidator):
+            return None
+        if not _inherits(validator, 'to_python', FancyValidator):
+            return None
+        if isinstance(validator, Schema):
+            plan = validator._get_plan()
+            if (plan.by_cost is not None or plan.track_dependencies
+                or (plan.skip_expensive and plan.expensive_fields)
+                or validator.result_cache is not None):
+                # Field order, skipping expensive fields, the chained
+                # validators' dependencies or the result cache matter;
+                # leave it to the schema
+                return None
+            if _inherits(validator, '_to_python', Schema):
+                return 'schema'
+            return None
+        if isinstance(validator, ForEach):
+            if validator._concurrent():
+                return None
+            if (_inherits(validator, 'attempt_convert', ForEach)
+                and _inherits(validator, '_to_python', CompoundValidator)):
+                return 'foreach'
+            return None
+        if isinstance(validator, All):
+            # Pipe is a subclass of All
+            if isinstance(validator, Pipe):
+                owner = Pipe
+            else:
+                owner = All
+            if _inherits(validator, 'attempt_convert', owner):
+                return owner is Pipe and 'pipe' or 'all'
+            return None
+        if hasattr(validator, 'attempt_convert'):
+            # Any and other compound validators
+            return None
+        return 'leaf'
+
+    def compile_function(self, validator):
+        """
+        Compiles ``validator`` into a module-level function, returning
+        its name.  Each validator is compiled only once.
+        """
+        validator = self.resolve(validator)
+        key = id(validator)
+        if key in self.compiled:
+            return self.compiled[key][0]
+        kind = self.kind(validator)
+        if kind is None:
+            name = self.const(validator.to_python, 'to_python')
+            self.compiled[key] = (name, validator)
+            return name
+        name = self.new_name('%s_%s' % (kind, type(validator).__name__))
+        self.compiled[key] = (name, validator)
+        lines = ['def %s(value, state):' % name]
+        if kind == 'schema':
+            core = self.schema_core
+        elif kind == 'foreach':
+            core = self.foreach_core
+        else:
+            core = None
+        self.wrapper(validator, 'value', 'value', lines, 1, core)
+        lines.append('    return value')
+        self.functions.append('\n'.join(lines))
+        return name
+
+    def block(self, validator, var_in, var_out, lines, indent):
+        """
+        Appends statements that convert ``var_in`` to ``var_out`` like
+        ``validator.to_python`` would, raising `Invalid` on errors.
+        """
+        validator = self.resolve(validator)
+        kind = self.kind(validator)
+        pad = '    ' * indent
+        if kind in ('leaf', 'all', 'pipe'):
+            self.wrapper(validator, var_in, var_out, lines, indent)
+        else:
+            func = self.compile_function(validator)
+            lines.append('%s%s = %s(%s, state)' % (pad, var_out, func, var_in))
+
+    def wrapper(self, validator, var_in, var_out, lines, indent, core=None):
+        """
+        The equivalent of `FancyValidator.to_python`, with every
+        setting resolved.  ``core`` generates the ``_to_python`` step;
+        by default the validator's own ``_to_python`` is called (or
+        the sub-validators run, for `All` and `Pipe`).
+        """
+        v = self.const(validator, 'v')
+        base_pad = pad = '    ' * indent
+        add = lines.append
+        if_invalid = validator.if_invalid
+        if if_invalid is not NoDefault:
+            add('%stry:' % pad)
+            indent += 1
+            pad = '    ' * indent
+        if var_in != var_out:
+            add('%s%s = %s' % (pad, var_out, var_in))
+        value = var_out
+        if validator.strip:
+            add('%sif isinstance(%s, (str, unicode)):' % (pad, value))
+            add('%s    %s = %s.strip()' % (pad, value, value))
+            add('%selif hasattr(%s, "mixed"):' % (pad, value))
+        else:
+            add('%sif hasattr(%s, "mixed"):' % (pad, value))
+        add('%s    %s = %s.mixed()' % (pad, value, value))
+        if _inherits(validator, 'is_empty', FancyValidator):
+            empty = ('%s is None or %s == "" or (isinstance(%s, '
+                     '(list, tuple, dict)) and not %s)'
+                     % (value, value, value, value))
+        elif self.never_empty(validator):
+            empty = None
+        else:
+            empty = '%s.is_empty(%s)' % (v, value)
+        if empty:
+            add('%sif %s:' % (pad, empty))
+            if validator.not_empty:
+                add('%s    raise Invalid(%s.lazy_message("empty", state), '
+                    '%s, state)' % (pad, v, value))
+            elif validator.if_empty is not NoDefault:
+                add('%s    %s = %s' % (pad, value,
+                                       self.const(validator.if_empty)))
+            elif _inherits(validator, 'empty_value', FancyValidator):
+                add('%s    %s = None' % (pad, value))
+            else:
+                add('%s    %s = %s.empty_value(%s)' % (pad, value, v, value))
+            add('%selse:' % pad)
+            indent += 1
+            pad = '    ' * indent
+        vo = _active_method(validator, 'validate_other')
+        if vo:
+            add('%s%s(%s, state)' % (pad, self.const(vo, 'vo'), value))
+        if core is not None:
+            core(validator, value, lines, indent)
+        elif isinstance(validator, All):
+            self.sequence_core(validator, value, lines, indent)
+        elif validator._has_to_python:
+            add('%s%s = %s(%s, state)' % (
+                pad, value, self.const(validator._to_python, 'tp'), value))
+        vp = _active_method(validator, 'validate_python')
+        if vp:
+            add('%s%s(%s, state)' % (pad, self.const(vp, 'vp'), value))
+        if if_invalid is not NoDefault:
+            add('%sexcept Invalid:' % base_pad)
+            add('%s    %s = %s' % (base_pad, var_out,
+                                   self.const(if_invalid)))
+
+    def never_empty(self, validator):
+        # Schema and the compound validators leave emptiness to their
+        # sub-validators:
+        for cls in (Schema, All):
+            if (isinstance(validator, cls)
+                and _inherits(validator, 'is_empty', cls)):
+                return True
+        return False
+
+    def sequence_core(self, validator, value, lines, indent):
+        """
+        ``All.attempt_convert`` / ``Pipe.attempt_convert`` for
+        ``to_python``.
+        """
+        pad = '    ' * indent
+        validators = list(validator.validators)
+        if not isinstance(validator, Pipe):
+            validators.reverse()
+        if_invalid = validator.if_invalid
+        if if_invalid is not NoDefault:
+            lines.append('%stry:' % pad)
+            indent += 1
+        if not validators:
+            lines.append('%spass' % ('    ' * indent))
+        for sub in validators:
+            self.block(sub, value, value, lines, indent)
+        if if_invalid is not NoDefault:
+            lines.append('%sexcept Invalid:' % pad)
+            lines.append('%s    %s = %s' % (pad, value,
+                                            self.const(if_invalid)))
+
+    def schema_core(self, schema, value, lines, indent):
+        """
+        ``Schema._to_python``, with the fields compiled into a
+        dispatch table of specialized functions.
+        """
+        plan = schema._get_plan()
+        s = self.const(schema, 'schema')
+        field_funcs = {}
+        for name, validator in plan.fields.items():
+            field_funcs[name] = self.compile_field(validator)
+        names = plan.fields.keys()
+        fields = self.new_name('fields')
+        self.links.append('%s = dict(zip(%s, [%s]))' % (
+            fields, self.const(names, 'names'),
+            ', '.join([field_funcs[name] for name in names])))
+        missing = self.new_name('missing')
+        entries = self.const(plan.missing_entries, 'entries')
+        self.links.append(
+            '%s = tuple([(name, validator, if_missing, missing_message, '
+            '%s[name]) for name, validator, if_missing, missing_message '
+            'in %s])' % (missing, fields, entries))
+        pad = '    ' * indent
+        src = []
+        add = src.append
+        add('value_dict = %s' % value)
+        add('if not value_dict:')
+        if schema.if_empty is not NoDefault:
+            add('    return %s' % self.const(schema.if_empty))
+        else:
+            add('    value_dict = {}')
+        for pre in plan.pre_validators:
+            add('value_dict = %s(value_dict, state)'
+                % self.const(self.resolve(pre).to_python, 'pre'))
+        add('%s.assert_dict(value_dict, state)' % s)
+        add('fail_fast = getattr(state, "fail_fast", %s)'
+            % self.const(schema.fail_fast))
+        add('new = {}')
+        add('errors = {}')
+        add('seen = {}')
+        add('if state is not None:')
+        add('    previous_key = getattr(state, "key", None)')
+        add('    previous_full_dict = getattr(state, "full_dict", None)')
+        add('    state.full_dict = value_dict')
+        add('try:')
+        add('    for name, item in value_dict.items():')
+        add('        try:')
+        add('            func = %s[name]' % fields)
+        add('        except KeyError:')
+        if not plan.allow_extra_fields:
+            add('            raise Invalid(%s.message("notExpected", state, '
+                'name=repr(name)), value_dict, state)' % s)
+        elif not plan.filter_extra_fields:
+            add('            new[name] = item')
+            add('            continue')
+        else:
+            add('            continue')
+        add('        seen[name] = None')
+        add('        try:')
+        add('            new[name] = func(item, state)')
+        add('        except Invalid, e:')
+        add('            errors[name] = e')
+        add('            if fail_fast:')
+        add('                break')
+        add('    if len(seen) < %i:' % len(plan.fields))
+        add('        for name, validator, if_missing, missing_message, func'
+            ' in %s:' % missing)
+        add('            if errors and fail_fast:')
+        add('                break')
+        add('            if name in seen:')
+        add('                continue')
+        add('            if if_missing is NoDefault:')
+        if plan.ignore_key_missing:
+            add('                continue')
+        elif plan.if_key_missing is NoDefault:
+            add('                if missing_message:')
+            add('                    message = validator.lazy_message('
+                '"missing", state)')
+            add('                else:')
+            add('                    message = %s.lazy_message('
+                '"missingValue", state)' % s)
+            add('                errors[name] = Invalid(message, None, state)')
+        else:
+            add('                try:')
+            add('                    new[name] = func(%s, state)'
+                % self.const(plan.if_key_missing))
+            add('                except Invalid, e:')
+            add('                    errors[name] = e')
+        add('            else:')
+        add('                new[name] = if_missing')
+        for validator in plan.partial_validators:
+            add('    if not (errors and fail_fast):')
+            add('        try:')
+            add('            %s(value_dict, state)'
+                % self.const(validator.validate_partial, 'partial'))
+            add('        except Invalid, e:')
+            add('            sub_errors = e.unpack_errors()')
+            add('            if isinstance(sub_errors, dict):')
+            add('                merge_dicts(errors, sub_errors)')
+        add('    if errors:')
+        add('        raise Invalid('
+            'LazyMessage(format_compound_error, errors), '
+            'value_dict, state, error_dict=errors)')
+        for validator in plan.chained_validators:
+            add('    new = %s(new, state)'
+                % self.const(self.resolve(validator).to_python, 'chained'))
+        add('    %s = new' % value)
+        add('finally:')
+        add('    if state is not None:')
+        add('        state.key = previous_key')
+        add('        state.full_dict = previous_full_dict')
+        lines.extend([pad + line for line in src])
+
+    def compile_field(self, validator):
+        """
+        Compiles a `Schema` field into a standalone function (fields
+        are dispatched by name, so they can't be inlined), returning
+        its name.
+        """
+        validator = self.resolve(validator)
+        kind = self.kind(validator)
+        if kind in ('schema', 'foreach', None):
+            return self.compile_function(validator)
+        name = self.new_name('field_%s' % type(validator).__name__)
+        lines = ['def %s(value, state):' % name]
+        self.block(validator, 'value', 'value', lines, 1)
+        lines.append('    return value')
+        self.functions.append('\n'.join(lines))
+        return name
+
+    def compile_items(self, validators):
+        """
+        Compiles the validators a `ForEach` applies to each item into
+        a function, returning its name.
+        """
+        if len(validators) == 1:
+            return self.compile_field(validators[0])
+        name = self.new_name('items')
+        lines = ['def %s(value, state):' % name]
+        for sub in validators:
+            self.block(sub, 'value', 'value', lines, 1)
+        lines.append('    return value')
+        self.functions.append('\n'.join(lines))
+        return name
+
+    def foreach_core(self, foreach, value, lines, indent):
+        """
+        ``ForEach.attempt_convert`` for ``to_python``.
+        """
+        f = self.const(foreach, 'foreach')
+        pad = '    ' * indent
+        src = []
+        add = src.append
+        if foreach.convert_to_list:
+            add('%s = %s._convert_to_list(%s)' % (value, f, value))
+        if foreach.if_empty is not NoDefault:
+            add('if not %s:' % value)
+            add('    %s = %s' % (value, self.const(foreach.if_empty)))
+            add('else:')
+            src_pad = '    '
+        else:
+            src_pad = ''
+        body = []
+        badd = body.append
+        if foreach.not_empty:
+            badd('if not %s:' % value)
+            badd('    raise Invalid(%s.lazy_message("empty", state), '
+                 '%s, state)' % (f, value))
+        # The loop itself is ForEach's; only the items are compiled:
+        badd('%s = %s._convert_list(%s, state, %s)'
+             % (value, f, value, self.compile_items(foreach.validators)))
+        src.extend([src_pad + line for line in body])
+        lines.extend([pad + line for line in src])
@@ -3,9 +3,12 @@ Validators for applying validations in sequence.
 """
 
 from api import *
+from api import _cost_of, _pure_of, _reissue
+from resultcache import freeze
+from util.lrucache import LRUCache
 
 # @@ ianb 2005-05: should CompoundValidator be included?
-__all__ = ['Any', 'All', 'Pipe']
+__all__ = ['Any', 'All', 'Pipe', 'Memoize']
 
 ############################################################
 ## Compound Validators
@@ -27,7 +30,14 @@ class CompoundValidator(FancyValidator):
 
     __mutableattributes__ = ('validators',)
 
+    # An explicit cost; by default it's the cost of the validators:
+    _cost = None
+    # Explicitly pure or not; by default it's pure if the validators
+    # are:
+    _pure = None
+
     def __classinit__(cls, new_attrs):
+        FancyValidator.__classinit__(cls, new_attrs)
         toAdd = []
         for name, value in new_attrs.items():
             if name in ('view',):
@@ -63,6 +73,29 @@ class CompoundValidator(FancyValidator):
     def subvalidators(self):
         return self.validators
 
+    def cost__get(self):
+        if self._cost is not None:
+            return self._cost
+        return max(1, sum([_cost_of(v) for v in self.validators]))
+
+    def cost__set(self, value):
+        self._cost = value
+
+    cost = property(cost__get, cost__set)
+
+    def pure__get(self):
+        if self._pure is not None:
+            return self._pure
+        for validator in self.validators:
+            if not _pure_of(validator):
+                return False
+        return True
+
+    def pure__set(self, value):
+        self._pure = value
+
+    pure = property(pure__get, pure__set)
+
 class Any(CompoundValidator):
     
     """
@@ -72,12 +105,10 @@ class Any(CompoundValidator):
     """
 
     def attempt_convert(self, value, state, validate):
-        lastException = None
         if validate is to_python:
-            validators = self.validators[::-1]
-        else:
-            validators = self.validators
-        for validator in validators:
+            return self._to_python_result(value, state).unwrap()
+        lastException = None
+        for validator in self.validators:
             try:
                 return validate(validator, value, state)
             except Invalid, e:
@@ -87,6 +118,16 @@ class Any(CompoundValidator):
         else:
             return self.if_invalid
 
+    def _to_python_result(self, value, state):
+        result = Result(value)
+        for validator in self.validators[::-1]:
+            result = validator.validate(value, state)
+            if result.errors is None:
+                return result
+        if result.errors is not None and self.if_invalid is not NoDefault:
+            return Result(self.if_invalid)
+        return result
+
     def not_empty__get(self):
         not_empty = True
         for validator in self.validators:
@@ -113,12 +154,9 @@ class All(CompoundValidator):
         # To preserve the order of the transformations, we do them
         # differently when we are converting to and from python.
         if validate is to_python:
-            validators = list(self.validators)
-            validators.reverse()
-        else:
-            validators = self.validators
+            return self._to_python_result(value, state).unwrap()
         try:
-            for validator in validators:
+            for validator in self.validators:
                 value = validate(validator, value, state)
             return value
         except Invalid:
@@ -126,6 +164,21 @@ class All(CompoundValidator):
                 raise
             return self.if_invalid
 
+    def _to_python_result(self, value, state):
+        validators = list(self.validators)
+        validators.reverse()
+        return self._convert_result(validators, value, state)
+
+    def _convert_result(self, validators, value, state):
+        for validator in validators:
+            result = validator.validate(value, state)
+            if result.errors is not None:
+                if self.if_invalid is not NoDefault:
+                    return Result(self.if_invalid)
+                return result
+            value = result.value
+        return Result(value)
+
     def with_validator(self, validator):
         """
         Adds the validator (or list of validators) to a copy of
@@ -203,11 +256,10 @@ class Pipe(All):
     def attempt_convert(self, value, state, validate):
         # To preserve the order of the transformations, we do them
         # differently when we are converting to and from python.
-        if validate is from_python:
-            validators = list(self.validators)
-            validators.reverse()
-        else:
-            validators = self.validators
+        if validate is to_python:
+            return self._to_python_result(value, state).unwrap()
+        validators = list(self.validators)
+        validators.reverse()
         try:
             for validator in validators:
                 value = validate(validator, value, state)
@@ -216,3 +268,123 @@ class Pipe(All):
             if self.if_invalid is NoDefault:
                 raise
             return self.if_invalid
+
+    def _to_python_result(self, value, state):
+        return self._convert_result(self.validators, value, state)
+
+class Memoize(Validator):
+
+    """
+    Caches the results of another validator -- converted values and
+    `Invalid` errors alike -- by the value being converted, keeping
+    the ``maxsize`` most recently used, for at most ``ttl`` seconds
+    (if given).  This only makes sense for validators whose result
+    depends on nothing but the value (see ``Validator.pure``).
+    Values are compared with their types, including the items of
+    lists, tuples, dictionaries and sets (see
+    ``resultcache.freeze``); values that can't be hashed, and
+    containers holding anything but plain data, aren't cached.
+    Errors are cached without their state, and handed out with the
+    caller's.
+
+    ::
+
+        >>> from validators import DictConverter
+        >>> m = Memoize(DictConverter({'one': 1}), maxsize=100)
+        >>> m.to_python('one'), m.to_python('one')
+        (1, 1)
+        >>> m.to_python('two')
+        Traceback (most recent call last):
+            ...
+        Invalid: Enter a value from: 'one'
+        >>> m.from_python(1)
+        'one'
+        >>> m.stats()['hits'], m.stats()['misses']
+        (1, 3)
+
+    Converted values are shared between callers, so they shouldn't
+    be modified.  The cache is safe to use from several threads.
+    """
+
+    validator = None
+    maxsize = 1000
+    ttl = None
+
+    __unpackargs__ = ('validator',)
+
+    # Caches aren't pickled; they're started afresh when unpickling:
+    __transientattributes__ = ('cache',)
+
+    def __initargs__(self, new_attrs):
+        if isinstance(self.validator, type):
+            self.validator = self.validator.singleton()
+        if not new_attrs.has_key('if_missing'):
+            self.if_missing = getattr(self.validator, 'if_missing',
+                                      NoDefault)
+        # So Schema gives the same "missing" message:
+        self._messages = self.validator._messages
+        if not new_attrs.has_key('pure'):
+            self.pure = _pure_of(self.validator)
+        self.cache = LRUCache(self.maxsize, self.ttl)
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache = LRUCache(self.maxsize, self.ttl)
+
+    def to_python(self, value, state=None):
+        return self.validate(value, state).unwrap()
+
+    def validate(self, value, state=None):
+        return self._cached('to_python', value, state, self.validator.validate)
+
+    def from_python(self, value, state=None):
+        return self._cached('from_python', value, state,
+                            self._from_python_result).unwrap()
+
+    def _from_python_result(self, value, state):
+        try:
+            return Result(self.validator.from_python(value, state))
+        except Invalid, e:
+            return Result(value, e)
+
+    def _cached(self, direction, value, state, convert):
+        try:
+            frozen = freeze(value)
+        except TypeError:
+            if isinstance(value, (list, tuple, dict, set, frozenset)):
+                return convert(value, state)
+            # Some other value (a date, say); it's still compared
+            # with its type, as 1, 1.0 and True are equal:
+            frozen = (type(value), value)
+        # Messages are translated, so the translator is part of the
+        # key:
+        key = (direction, frozen, self.validator.get_translator(state))
+        try:
+            result = self.cache.get(key)
+        except TypeError:
+            # Unhashable value
+            return convert(value, state)
+        if result is None:
+            result = convert(value, state)
+            if result.errors is None:
+                self.cache.set(key, result)
+                return result
+            # Keep no state anywhere in the error; the errors given
+            # back are made from this copy whether it came from the
+            # cache or not, so they're the same either way:
+            result = Result(value, result.errors.compact())
+            self.cache.set(key, result)
+        if result.errors is not None:
+            return Result(value, _reissue(result.errors, value, state))
+        return result
+
+    def stats(self):
+        """
+        Returns a dictionary of the cache's ``hits``, ``misses`` and
+        ``size``.
+        """
+        return {'hits': self.cache.hits, 'misses': self.cache.misses,
+                'size': len(self.cache)}
+
+    def subvalidators(self):
+        return [self.validator]
@@ -7,6 +7,10 @@ you give to the constructor will override those instance variables.
 (So if a class is received, we'll simply instantiate an instance with
 no arguments).
 
+Instances pickle like normal objects, except that the instance
+attributes named in __transientattributes__ (caches and the like,
+which are rebuilt on demand) are left out.
+
 You can provide a variable __unpackargs__ (a list of strings), and if
 the constructor is called with non-keyword arguments they will be
 interpreted as the given keyword arguments.
@@ -16,6 +20,11 @@ in a variable by that name.
 
 Also, you can define a __classinit__(cls, new_attrs) method, which
 will be called when the class is created (including subclasses).
+
+Each class has a singleton instance (``cls.singleton()``), created
+once even when several threads ask for it at the same time; methods
+listed in __singletonmethods__ are called on it when they're called
+on the class.
 """
 
 from __future__ import generators
@@ -34,6 +43,37 @@ except ImportError:
             yield i
     counter = _counter()
 
+try:
+    import threading
+except ImportError:
+    threading = None
+
+class _DummyLock(object):
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+if threading is None:
+    _count_lock = _singleton_lock = _DummyLock()
+else:
+    _count_lock = threading.Lock()
+    # Reentrant, as creating a singleton can create other singletons
+    # (e.g., of a schema's fields):
+    _singleton_lock = threading.RLock()
+
+def next_count():
+    """
+    The next value of the counter used for ``declarative_count``.
+    """
+    _count_lock.acquire()
+    try:
+        return counter.next()
+    finally:
+        _count_lock.release()
+
 class classinstancemethod(object):
     """
     Acts like a class method when called from a class, like an
@@ -76,7 +116,7 @@ class DeclarativeMeta(type):
         cls = type.__new__(meta, class_name, bases, new_attrs)
         for name in cls.__mutableattributes__:
             setattr(cls, name, copy.copy(getattr(cls, name)))
-        cls.declarative_count = counter.next()
+        cls.declarative_count = next_count()
         if (new_attrs.has_key('__classinit__')
             and not isinstance(cls.__classinit__, staticmethod)):
             setattr(cls, '__classinit__',
@@ -95,14 +135,23 @@ class singletonmethod(object):
     For Declarative subclasses, this decorator will call the method
     on the cls.singleton() object if called as a class method (or
     as normal if called as an instance method).
+
+    The singleton's bound method is made once per class (and kept in
+    the class, like the singleton), so calling the method on the class
+    doesn't create anything.
     """
 
     def __init__(self, func):
         self.func = func
+        self.bound_name = '_singletonmethod_%s' % func.__name__
 
     def __get__(self, obj, type=None):
         if obj is None:
-            obj = type.singleton()
+            meth = type.__dict__.get(self.bound_name)
+            if meth is None:
+                meth = new.instancemethod(self.func, type.singleton(), type)
+                setattr(type, self.bound_name, meth)
+            return meth
         if type is None:
             type = obj.__class__
         return new.instancemethod(self.func, obj, type)
@@ -113,6 +162,8 @@ class Declarative(object):
 
     __mutableattributes__ = ()
 
+    __transientattributes__ = ()
+
     __metaclass__ = DeclarativeMeta
 
     __singletonmethods__ = ()
@@ -149,22 +200,38 @@ class Declarative(object):
         for name, value in kw.items():
             setattr(self, name, value)
         if not kw.has_key('declarative_count'):
-            self.declarative_count = counter.next()
+            self.declarative_count = next_count()
         self.__initargs__(kw)
 
     def __initargs__(self, new_attrs):
         pass
 
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name in self.__transientattributes__:
+            if state.has_key(name):
+                del state[name]
+        return state
+
     def __call__(self, *args, **kw):
         current = self.__dict__.copy()
         current.update(kw)
         return self.__class__(*args, **current)
 
     def singleton(cls):
+        # Only look in this class, not its superclasses:
         name = '_%s__singleton' % cls.__name__
-        if not hasattr(cls, name):
-            setattr(cls, name, cls(declarative_count=cls.declarative_count))
-        return getattr(cls, name)
+        singleton = cls.__dict__.get(name)
+        if singleton is None:
+            _singleton_lock.acquire()
+            try:
+                singleton = cls.__dict__.get(name)
+                if singleton is None:
+                    singleton = cls(declarative_count=cls.declarative_count)
+                    setattr(cls, name, singleton)
+            finally:
+                _singleton_lock.release()
+        return singleton
     singleton = classmethod(singleton)
 
     def __sourcerepr__(self, source, binding=None):
@@ -10,8 +10,15 @@ try:
     set
 except NameError:
     set = Set
+import copy
+import sys
+try:
+    import threading
+except ImportError:
+    threading = None
 
-from api import NoDefault, Invalid
+from api import NoDefault, Invalid, Result, LazyMessage, SparseErrorList
+from api import _compact_record
 from compound import CompoundValidator, to_python, from_python
 
 __all__ = ['ForEach']
@@ -39,15 +46,44 @@ class ForEach(CompoundValidator):
     ForEach will try to convert the entire list, even if errors are
     encountered.  If errors are encountered, they will be collected
     and a single Invalid exception will be raised at the end (with
-    error_list set).
+    error_list set).  error_list is a list with None for the valid
+    items.  Set sparse_errors=True to get a `SparseErrorList` instead,
+    which acts the same but only stores the errors; use this for long
+    lists, which would otherwise have a None for every valid item.
+
+    Set fail_fast=True (or give the state a true ``fail_fast``
+    attribute) to stop at the first invalid item instead; error_list
+    then ends with that item's error.
+
+    With compact_errors=True, the errors in error_list are compact
+    `ErrorRecord` objects, without the items' values or the state
+    (see `Invalid.compact`); use this for long lists that may have
+    lots of invalid items.
 
     If the incoming value is a set, then we return a set.
+
+    To validate a stream too big to hold in memory, use
+    ``.iter_to_python()``, which converts the items as they're read.
+
+    If the item validators spend their time waiting (looking up
+    domains, querying a database...), set concurrency to the number
+    of items to validate at a time, on that many threads.  The
+    results and errors are in the same order as usual, and each item
+    gets its own (shallow) copy of the state, with its own ``index``
+    and ``full_list``; the state given isn't modified.
     """
 
     convert_to_list = True
+    fail_fast = False
+    compact_errors = False
+    sparse_errors = False
+    concurrency = None
     if_empty = NoDefault
     repeating = True
     _if_missing = ()
+
+    __singletonmethods__ = CompoundValidator.__singletonmethods__ + (
+        'iter_to_python',)
     
     def attempt_convert(self, value, state, validate):
         if self.convert_to_list:
@@ -58,60 +94,319 @@ class ForEach(CompoundValidator):
             if validate is from_python and self.accept_python:
                 return []
             raise Invalid(
-                self.message('empty', state),
+                self.lazy_message('empty', state),
                 value, state)
-        new_list = []
-        errors = []
-        all_good = True
-        is_set = isinstance(value, (set, Set))
-        if state is not None:
-            previous_index = getattr(state, 'index', NoDefault)
-            previous_full_list = getattr(state, 'full_list', NoDefault)
-            index = 0
-            state.full_list = value
+        if self._concurrent():
+            return self._validate_concurrently(
+                value, state, self._item_validator(validate)).unwrap()
+        return self._convert_list(value, state,
+                                  self._item_converter(validate))
+
+    def _to_python_result(self, value, state):
+        if self.convert_to_list:
+            value = self._convert_to_list(value)
+        if self.if_empty is not NoDefault and not value:
+            return Result(self.if_empty)
+        if self.not_empty and not value:
+            return Result(value, Invalid(
+                self.lazy_message('empty', state),
+                value, state))
+        validate_item = self._item_validator(to_python)
+        if self._concurrent():
+            return self._validate_concurrently(value, state, validate_item)
+        return self._validate_list(value, state, validate_item)
+
+    def _item_converter(self, validate):
+        """
+        Returns a function ``convert_item(sub_value, state)`` that
+        converts an item with all the validators (using ``validate``,
+        `to_python` or `from_python`), raising `Invalid`.
+        """
+        validators = self.validators
+        if len(validators) == 1:
+            # The usual case; skip a layer of calls:
+            if validate is to_python:
+                return validators[0].to_python
+            if validate is from_python:
+                return validators[0].from_python
+        def convert_item(sub_value, state):
+            for validator in validators:
+                sub_value = validate(validator, sub_value, state)
+            return sub_value
+        return convert_item
+
+    def _item_validator(self, validate):
+        """
+        Like `_item_converter`, but the function returns a `Result`
+        instead of raising; for `to_python`, the validators'
+        ``.validate()`` is used, so errors are never raised.
+        """
+        validators = self.validators
+        if validate is not to_python:
+            convert_item = self._item_converter(validate)
+            def validate_item(sub_value, state):
+                try:
+                    return Result(convert_item(sub_value, state))
+                except Invalid, e:
+                    return Result(sub_value, e)
+            return validate_item
+        if len(validators) == 1:
+            return validators[0].validate
+        def validate_item(sub_value, state):
+            for validator in validators:
+                result = validator.validate(sub_value, state)
+                if result.errors is not None:
+                    return result
+                sub_value = result.value
+            return Result(sub_value)
+        return validate_item
+
+    def _convert_items(self, values, state, convert_item, errors):
+        """
+        Yields every item of ``values`` converted with
+        ``convert_item(sub_value, state)``, leaving out the invalid
+        ones: their errors go in ``errors`` (a `SparseErrorList`), by
+        position.  Once there are no more items (or, with fail_fast,
+        at the first invalid one), the length of ``errors`` is set to
+        the number of items seen.  ``state.index`` and
+        ``state.full_list`` are set for the sub-validators meanwhile.
+
+        This is the loop behind ``.to_python()``, ``.from_python()``
+        and ``.iter_to_python()``; `_validate_items` is the same loop
+        for ``.validate()``, without exceptions.
+        """
+        by_index = errors.by_index
+        fail_fast = getattr(state, 'fail_fast', self.fail_fast)
+        compact_errors = self.compact_errors
+        count = 0
+        saved = self._push_state(values, state)
         try:
-            for sub_value in value:
+            for sub_value in values:
                 if state:
-                    state.index = index
-                    index += 1
-                good_pass = True
-                for validator in self.validators:
-                    try:
-                        sub_value = validate(validator, sub_value, state)
-                    except Invalid, e:
-                        errors.append(e)
-                        all_good = False
-                        good_pass = False
+                    state.index = count
+                try:
+                    sub_value = convert_item(sub_value, state)
+                except Invalid, e:
+                    if compact_errors:
+                        e = _compact_record(e, False, False)
+                    by_index[count] = e
+                    count += 1
+                    if fail_fast:
                         break
-                if good_pass:
-                    errors.append(None)
-                new_list.append(sub_value)
-            if all_good:
-                if is_set:
-                    new_list = set(new_list)
-                return new_list
-            else:
-                raise Invalid(
-                    'Errors:\n%s' % '\n'.join([unicode(e) for e in errors if e]),
-                    value,
-                    state,
-                    error_list=errors)
+                else:
+                    count += 1
+                    yield sub_value
+            errors.length = count
         finally:
-            if state is not None:
-                if previous_index is NoDefault:
-                    try:
-                        del state.index
-                    except AttributeError:
-                        pass
+            self._pop_state(saved, state)
+
+    def _convert_list(self, value, state, convert_item, items=None):
+        """
+        Converts every item of ``value`` (or of ``items``, if given)
+        with ``convert_item`` (see `_convert_items`), returning the
+        new list (or set, if ``value`` is one), or raising `Invalid`
+        with the errors of the invalid items.
+        """
+        if items is None:
+            items = value
+        errors = SparseErrorList()
+        new_list = list(self._convert_items(items, state, convert_item,
+                                            errors))
+        if errors.by_index:
+            raise self._list_error(value, state, errors)
+        if isinstance(value, (set, Set)):
+            new_list = set(new_list)
+        return new_list
+
+    def _validate_items(self, values, state, validate_item, errors):
+        """
+        `_convert_items`, with ``validate_item(sub_value, state)``
+        returning a `Result` for each item instead of raising.
+        """
+        by_index = errors.by_index
+        fail_fast = getattr(state, 'fail_fast', self.fail_fast)
+        compact_errors = self.compact_errors
+        count = 0
+        saved = self._push_state(values, state)
+        try:
+            for sub_value in values:
+                if state:
+                    state.index = count
+                result = validate_item(sub_value, state)
+                error = result.errors
+                if error is None:
+                    count += 1
+                    yield result.value
                 else:
-                    state.index = previous_index
-                if previous_full_list is NoDefault:
+                    if compact_errors:
+                        error = _compact_record(error, False, False)
+                    by_index[count] = error
+                    count += 1
+                    if fail_fast:
+                        break
+            errors.length = count
+        finally:
+            self._pop_state(saved, state)
+
+    def _validate_list(self, value, state, validate_item, items=None):
+        """
+        `_convert_list`, returning a `Result` (see `_validate_items`).
+        """
+        if items is None:
+            items = value
+        errors = SparseErrorList()
+        new_list = list(self._validate_items(items, state, validate_item,
+                                             errors))
+        if errors.by_index:
+            return Result(value, self._list_error(value, state, errors))
+        if isinstance(value, (set, Set)):
+            new_list = set(new_list)
+        return Result(new_list)
+
+    def _list_error(self, value, state, errors):
+        # The errors are collected sparsely either way:
+        if not self.sparse_errors:
+            errors = errors.dense()
+        return Invalid(
+            LazyMessage(format_list_errors, errors),
+            value, state, error_list=errors)
+
+    def _concurrent(self):
+        return (threading is not None and self.concurrency is not None
+                and self.concurrency > 1)
+
+    def _validate_concurrently(self, value, state, validate_item):
+        """
+        Calls ``validate_item(sub_value, item_state)``, which returns a
+        `Result`, for every item of ``value``, on up to
+        ``self.concurrency`` threads, then puts the results together
+        like `_validate_list` does.
+        """
+        items = list(value)
+        results = [None] * len(items)
+        fail_fast = getattr(state, 'fail_fast', self.fail_fast)
+        # Items are handed out in order; with fail_fast, no more are
+        # once one fails, so the ones before it are all done:
+        positions = iter(xrange(len(items)))
+        lock = threading.Lock()
+        stopped = []
+        raised = []
+        def work():
+            while 1:
+                lock.acquire()
+                try:
+                    if stopped:
+                        return
                     try:
-                        del state.full_list
-                    except AttributeError:
-                        pass
-                else:
-                    state.full_list = previous_full_list
+                        index = positions.next()
+                    except StopIteration:
+                        return
+                finally:
+                    lock.release()
+                item_state = state
+                if state is not None:
+                    item_state = copy.copy(state)
+                    item_state.full_list = value
+                    item_state.index = index
+                try:
+                    result = validate_item(items[index], item_state)
+                except:
+                    raised.append(sys.exc_info())
+                    stopped.append(index)
+                    return
+                results[index] = result
+                if result.errors is not None and fail_fast:
+                    stopped.append(index)
+        threads = [threading.Thread(target=work)
+                   for i in range(min(self.concurrency, len(items)))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if raised:
+            exc_type, exc_value, tb = raised[0]
+            raise exc_type, exc_value, tb
+        if None in results:
+            # Not run, after a fail_fast error
+            results = results[:results.index(None)]
+        return self._validate_list(value, state, _given_result, results)
+
+    def iter_to_python(self, values, state=None):
+        """
+        Converts the items of ``values`` (any iterable, e.g. a
+        generator reading a file) one at a time, yielding each
+        converted item as soon as it's valid; nothing is kept but the
+        errors, so this uses constant memory for valid input::
+
+            for row in ForEach(RowSchema).iter_to_python(read_rows(f)):
+                store(row)
+
+        Invalid items aren't yielded.  Once ``values`` is exhausted,
+        `Invalid` is raised if any item was invalid, with the errors
+        as error_list (a `SparseErrorList` with sparse_errors, which
+        saves keeping a None for every valid item) and no value; with
+        fail_fast, it's raised at the first invalid item.
+        ``state.full_list`` is ``values`` itself.
+
+        Strings and None are treated like ``.to_python()`` does, but
+        other values are iterated as they are, without checking if
+        they're sequences first.
+
+        If there are no items, the items of ``if_empty`` are yielded,
+        if it is set; it is turned into a list the way
+        ``convert_to_list`` does, so ``if_empty=None`` yields nothing,
+        and a string or any other value that isn't iterable is yielded
+        as the one item.
+        """
+        if isinstance(values, (str, unicode)):
+            values = [values]
+        elif values is None:
+            values = []
+        errors = SparseErrorList()
+        for sub_value in self._convert_items(
+                values, state, self._item_converter(to_python), errors):
+            yield sub_value
+        if errors.by_index:
+            raise self._list_error(None, state, errors)
+        if not errors.length:
+            if self.if_empty is not NoDefault:
+                for sub_value in self._convert_to_list(self.if_empty):
+                    yield sub_value
+            elif self.not_empty:
+                raise Invalid(self.lazy_message('empty', state),
+                              None, state)
+
+    def _push_state(self, value, state):
+        """
+        Sets ``state.full_list`` (and, as we go, ``state.index``) for
+        the sub-validators, returning what ``_pop_state`` needs to put
+        things back.
+        """
+        if state is None:
+            return None
+        saved = (getattr(state, 'index', NoDefault),
+                 getattr(state, 'full_list', NoDefault))
+        state.full_list = value
+        return saved
+
+    def _pop_state(self, saved, state):
+        if state is None:
+            return
+        previous_index, previous_full_list = saved
+        if previous_index is NoDefault:
+            try:
+                del state.index
+            except AttributeError:
+                pass
+        else:
+            state.index = previous_index
+        if previous_full_list is NoDefault:
+            try:
+                del state.full_list
+            except AttributeError:
+                pass
+        else:
+            state.full_list = previous_full_list
 
     def empty_value(self, value):
         return []
@@ -146,3 +441,13 @@ class ForEach(CompoundValidator):
         ## @@: Should this catch any other errors?:
         except TypeError:
             return [value]
+
+def _given_result(result, state):
+    # The validate_item of the items ForEach._validate_concurrently
+    # has already validated:
+    return result
+
+def format_list_errors(errors):
+    if isinstance(errors, SparseErrorList):
+        errors = [e for index, e in errors.items()]
+    return 'Errors:\n%s' % '\n'.join([unicode(e) for e in errors if e])
@@ -1,15 +1,21 @@
 """
 Parser for HTML forms, that fills in defaults and errors.  See
 ``render``.
+
+A form that is filled over and over can be parsed once with
+``htmlfill.compile`` (which isn't exported by ``import *``, as it
+would hide the builtin), and the resulting `FillPlan` rendered
+instead.  To send a large form out as it is filled, use
+``render_iter`` or ``render_to``.
 """
 
 import HTMLParser
 import re
 from formencode.rewritingparser import RewritingParser, html_quote
 
-__all__ = ['render', 'htmlliteral', 'default_formatter',
-           'none_formatter', 'escape_formatter',
-           'FillingParser']
+__all__ = ['render', 'render_iter', 'render_to', 'FillPlan',
+           'htmlliteral', 'default_formatter', 'none_formatter',
+           'escape_formatter', 'FillingParser']
 
 def render(form, defaults=None, errors=None, use_all_keys=False,
            error_formatters=None, add_attributes=None,
@@ -18,11 +24,11 @@ def render(form, defaults=None, errors=None, use_all_keys=False,
            error_class='error', prefix_error=True,
            force_defaults=True):
     """
-    Render the ``form`` (which should be a string) given the defaults
-    and errors.  Defaults are the values that go in the input fields
-    (overwriting any values that are there) and errors are displayed
-    inline in the form (and also effect input classes).  Returns the
-    rendered string.
+    Render the ``form`` (which should be a string, or a `FillPlan`
+    made by ``compile``) given the defaults and errors.  Defaults are
+    the values that go in the input fields (overwriting any values
+    that are there) and errors are displayed inline in the form (and
+    also effect input classes).  Returns the rendered string.
 
     If ``auto_insert_errors`` is true (the default) then any errors
     for which ``<form:error>`` tags can't be found will be put just
@@ -68,11 +74,82 @@ def render(form, defaults=None, errors=None, use_all_keys=False,
     and textareas will be emptied. This defaults to ``True``, which is
     appropriate the defaults are the result of a form submission.
     """
+    p = _make_parser(
+        form, defaults=defaults, errors=errors,
+        use_all_keys=use_all_keys,
+        error_formatters=error_formatters,
+        add_attributes=add_attributes,
+        auto_insert_errors=auto_insert_errors,
+        auto_error_formatter=auto_error_formatter,
+        text_as_default=text_as_default,
+        listener=listener, encoding=encoding,
+        error_class=error_class,
+        prefix_error=prefix_error,
+        force_defaults=force_defaults,
+        )
+    if isinstance(form, FillPlan):
+        form.fill(p)
+    else:
+        p.feed(form)
+        p.close()
+    return p.text()
+
+def render_iter(form, defaults=None, errors=None, **options):
+    """
+    Like ``render(form, defaults, errors, **options)``, but yields
+    the filled form in chunks, each as soon as it can't change any
+    more, without holding the whole result (so it can be returned
+    from a WSGI application, for instance).
+
+    Only the parts of the form that may still get an error inserted
+    by ``auto_insert_errors`` are held back: that's everything from
+    the first field with an unused error (as we can't know if a
+    ``<form:error>`` tag further down will use it), or the whole form
+    while there are errors for fields that haven't been seen yet (as
+    those go at the top).  Problems ``use_all_keys`` finds are only
+    raised at the end, after the rest has been yielded.
+    """
+    p = _make_parser(form, defaults=defaults, errors=errors, **options)
+    if isinstance(form, FillPlan):
+        steps = form.fill_steps(p)
+    else:
+        steps = p.feed_steps(form)
+    for step in steps:
+        chunk = p.take_ready()
+        if chunk:
+            yield chunk
+    p.finish()
+    chunk = p.take_ready()
+    if chunk:
+        yield chunk
+
+def render_to(writer, form, defaults=None, errors=None, **options):
+    """
+    Writes the filled form to ``writer`` (anything with a ``.write()``
+    method), in chunks as it's filled; see ``render_iter``.
+    """
+    for chunk in render_iter(form, defaults, errors, **options):
+        writer.write(chunk)
+
+def _make_parser(form, defaults=None, errors=None, use_all_keys=False,
+                 error_formatters=None, add_attributes=None,
+                 auto_insert_errors=True, auto_error_formatter=None,
+                 text_as_default=False, listener=None, encoding=None,
+                 error_class='error', prefix_error=True,
+                 force_defaults=True):
+    """
+    The parser to fill ``form`` (a string or a `FillPlan`) with, given
+    the options of ``render``.
+    """
     if defaults is None:
         defaults = {}
     if auto_insert_errors and auto_error_formatter is None:
         auto_error_formatter = default_formatter
-    p = FillingParser(
+    if isinstance(form, FillPlan):
+        parser_class = _PlanFillingParser
+    else:
+        parser_class = FillingParser
+    return parser_class(
         defaults=defaults, errors=errors,
         use_all_keys=use_all_keys,
         error_formatters=error_formatters,
@@ -84,10 +161,166 @@ def render(form, defaults=None, errors=None, use_all_keys=False,
         error_class=error_class,
         force_defaults=force_defaults,
         )
-    p.feed(form)
-    p.close()
-    return p.text()
-        
+
+def compile(form):
+    """
+    Parses ``form`` (a string) once, and returns a `FillPlan` that
+    can be rendered with any defaults and errors, without parsing the
+    form again::
+
+        >>> plan = compile('<input type="text" name="a" value="x">')
+        >>> plan.render({'a': 'y'})
+        '<input type="text" name="a" value="y">'
+        >>> plan.render({'a': 'z'}) == render(
+        ...     '<input type="text" name="a" value="x">', {'a': 'z'})
+        True
+    """
+    recorder = _PlanRecorder()
+    recorder.feed(form)
+    return recorder.plan()
+
+# The kinds of events in a FillPlan:
+MISC, STARTTAG, STARTENDTAG, ENDTAG = range(4)
+
+class FillPlan(object):
+
+    """
+    A form parsed by ``compile``: the tags `FillingParser` acts on,
+    in order, each with the source text that precedes it.  Rendering
+    a plan (with ``.render()``, or by passing it to ``render()``
+    instead of the form) runs `FillingParser` over these events
+    instead of parsing the form, and gives exactly the same result.
+
+    Plans don't change once made, so one plan can be shared between
+    threads, cached, or pickled.
+    """
+
+    def __init__(self, events, close_event, tail_events, data_is_str):
+        # Each event is (kind, position, text, tag, attrs):
+        self.events = events
+        # The position and text for the end of the data fed in:
+        self.close_event = close_event
+        # Events for data HTMLParser only handles when it's closed:
+        self.tail_events = tail_events
+        self.data_is_str = data_is_str
+
+    def render(self, defaults=None, errors=None, **options):
+        """
+        Renders the form, like ``render(form, defaults, errors,
+        **options)``.
+        """
+        return render(self, defaults, errors, **options)
+
+    def render_many(self, fills, **options):
+        """
+        Renders the form for each ``(defaults, errors)`` pair in
+        ``fills``, with the same options, and returns the list of
+        results.
+        """
+        return [render(self, defaults, errors, **options)
+                for defaults, errors in fills]
+
+    def fill(self, parser):
+        """
+        Runs ``parser`` (a `FillingParser` made to replay plans) over
+        the events, and closes it.
+        """
+        for step in self.fill_steps(parser):
+            pass
+        parser.close()
+
+    def fill_steps(self, parser, size=256):
+        """
+        Like ``.fill()``, but yields after every ``size`` events, and
+        doesn't close the parser.
+        """
+        parser.data_is_str = self.data_is_str
+        if parser.listener:
+            parser.listener.reset()
+        parser.replay_events = self.tail_events
+        events = self.events
+        for start in range(0, len(events), size):
+            _replay(parser, events[start:start+size])
+            yield None
+        parser.event_pos, parser.event_text = self.close_event
+
+    def __repr__(self):
+        return '<%s events=%i>' % (self.__class__.__name__,
+                                   len(self.events) + len(self.tail_events))
+
+def _replay(parser, events):
+    for kind, pos, text, tag, attrs in events:
+        parser.event_pos = pos
+        parser.event_text = text
+        if kind == MISC:
+            parser.handle_misc(None)
+        elif kind == STARTTAG:
+            parser.handle_starttag(tag, list(attrs))
+        elif kind == STARTENDTAG:
+            parser.handle_startendtag(tag, list(attrs))
+        else:
+            parser.handle_endtag(tag)
+
+class _PlanRecorder(RewritingParser):
+
+    """
+    Parses a form into a `FillPlan`.
+    """
+
+    def __init__(self):
+        RewritingParser.__init__(self)
+        self.events = []
+        # Whether a MISC event can be merged into the last event: only
+        # if that's a MISC event, and not the first after a tag (which
+        # may be skipped, when it follows a tag that was rewritten):
+        self.mergeable = False
+
+    def record(self, kind, tag=None, attrs=None):
+        pos = self.getpos()
+        text = self.source_text(self.source_pos, pos)
+        self.source_pos = pos
+        if kind == MISC and self.mergeable:
+            last = self.events[-1]
+            self.events[-1] = (MISC, pos, last[2] + text, None, None)
+            return
+        self.mergeable = kind == MISC and self.events and (
+            self.events[-1][0] == MISC)
+        if attrs is not None:
+            attrs = tuple(attrs)
+        self.events.append((kind, pos, text, tag, attrs))
+
+    def handle_misc(self, whatever):
+        self.record(MISC)
+    handle_charref = handle_misc
+    handle_entityref = handle_misc
+    handle_data = handle_misc
+    handle_comment = handle_misc
+    handle_decl = handle_misc
+    handle_pi = handle_misc
+    unknown_decl = handle_misc
+
+    def handle_starttag(self, tag, attrs):
+        self.record(STARTTAG, tag, attrs)
+
+    def handle_startendtag(self, tag, attrs):
+        self.record(STARTENDTAG, tag, attrs)
+
+    def handle_endtag(self, tag):
+        self.record(ENDTAG, tag)
+
+    def plan(self):
+        events = self.events
+        pos = self.getpos()
+        close_event = (pos, self.source_text(self.source_pos, pos))
+        self.source_pos = pos
+        # FillingParser.close() handles the end of the data fed in
+        # before closing HTMLParser, which may handle a little more:
+        self.events = []
+        self.mergeable = False
+        RewritingParser.close(self)
+        tail_events = self.events
+        return FillPlan(tuple(events), close_event, tuple(tail_events),
+                        self.data_is_str)
 
 class htmlliteral(object):
 
@@ -188,19 +421,29 @@ class FillingParser(RewritingParser):
                  force_defaults=True):
         RewritingParser.__init__(self)
         self.source = None
-        self.lines = None
+        self.line_starts = None
         self.source_pos = None
         self.defaults = defaults
         self.in_textarea = None
         self.skip_textarea = False
         self.last_textarea_name = None
         self.in_select = None
+        self.selection = None
         self.skip_next = False        
         self.errors = errors or {}
         if isinstance(self.errors, (str, unicode)):
             self.errors = {None: self.errors}
         self.in_error = None
         self.skip_error = False
+        # The first place each marker was written, as (position in
+        # _content, order in which the markers were first written):
+        self.markers = {}
+        # Texts to insert at those places, and at the very start:
+        self.insertions = {}
+        self.start_insertions = []
+        # How many pieces of content take_ready() has taken out:
+        self.taken = 0
+        self.finished = False
         self.use_all_keys = use_all_keys
         self.used_keys = {}
         self.used_errors = {}
@@ -222,11 +465,7 @@ class FillingParser(RewritingParser):
         Compare the two objects as strings (coercing to strings if necessary).
         Also uses encoding to compare the strings.
         """
-        if not isinstance(str1, basestring):
-            if hasattr(str1, '__unicode__'):
-                str1 = unicode(str1)
-            else:
-                str1 = str(str1)
+        str1 = self.stringify(str1)
         if type(str1) == type(str2):
             return str1 == str2
         if isinstance(str1, unicode):
@@ -236,6 +475,14 @@ class FillingParser(RewritingParser):
         return str1 == str2
 
     def close(self):
+        self.finish()
+        self._text = self._get_text()
+
+    def finish(self):
+        """
+        Closes the parser, inserting the unused errors, but leaves the
+        content (what's left after ``take_ready()``) in pieces.
+        """
         self.handle_misc(None)
         RewritingParser.close(self)
         unused_errors = self.errors.copy()
@@ -264,14 +511,16 @@ class FillingParser(RewritingParser):
                 assert False, (
                     "These errors were not used in the form: %s" % 
                     ', '.join(error_text))
+        content = self.content_with_insertions()
         if self.encoding is not None:
             new_content = []
-            for item in self._content:
+            for item in content:
                 if isinstance(item, str):
                     item = item.decode(self.encoding)
                 new_content.append(item)
-            self._content = new_content
-        self._text = self._get_text()
+            content = new_content
+        self._content = content
+        self.finished = True
 
     def skip_output(self):
         return (self.in_textarea and self.skip_textarea) or self.skip_error
@@ -466,6 +715,9 @@ class FillingParser(RewritingParser):
             and self.errors.get(name)):
             self.add_class(attrs, self.error_class)
         self.in_select = self.get_attr(attrs, 'name', False)
+        if self.in_select and self.force_defaults:
+            self.selection = self.selection_set(
+                self.defaults.get(self.in_select, ''))
         self.write_tag('select', attrs)
         self.skip_next = True
         self.add_key(self.in_select)
@@ -476,16 +728,21 @@ class FillingParser(RewritingParser):
         if not self.prefix_error and self.in_select:
             self.write_marker(self.in_select)
         self.in_select = None
+        self.selection = None
 
     def handle_option(self, attrs):
         assert self.in_select is not None, (
             "<option> outside of <select>: line %i, column %i"
             % self.getpos())
         if self.in_select != False:
-            default = self.defaults.get(self.in_select, '')
             if self.force_defaults:
-                if self.selected_multiple(self.defaults.get(self.in_select, ''),
-                                          self.get_attr(attrs, 'value', '')):
+                value = self.get_attr(attrs, 'value', '')
+                if self.selection is None:
+                    selected = self.selected_multiple(
+                        self.defaults.get(self.in_select, ''), value)
+                else:
+                    selected = self.selection_key(value) in self.selection
+                if selected:
                     self.set_attr(attrs, 'selected', 'selected')
                     self.add_key(self.in_select)
                 else:
@@ -512,16 +769,121 @@ class FillingParser(RewritingParser):
                     return True
         return self.str_compare(obj, value)
 
+    def selection_set(self, obj):
+        """
+        Precomputes ``selected_multiple(obj, value)`` for a ``<select>``:
+        returns a set such that ``self.selection_key(value) in set``
+        gives the same answer (so each ``<option>`` is just a lookup),
+        or None if ``obj`` is a single string (which is compared
+        directly anyway) or a container whose ``__contains__`` or items
+        may compare in other ways.
+        """
+        key = self.selection_key
+        if obj is None:
+            return set([''])
+        if isinstance(obj, basestring):
+            # One comparison already
+            return None
+        if isinstance(obj, (list, tuple, set, frozenset, dict)):
+            keys = set([key(self.stringify(obj))])
+            for inner in obj:
+                if (inner is not None
+                    and not isinstance(inner, _simple_types)):
+                    return None
+                keys.add(key(self.stringify(inner)))
+            return keys
+        if hasattr(obj, '__contains__') or hasattr(obj, '__iter__'):
+            return None
+        return set([key(self.stringify(obj))])
+
+    def selection_key(self, value):
+        """
+        ``value`` as `selection_set` stores it: str_compare() compares
+        strings encoded, so unicode strings are encoded.
+        """
+        if isinstance(value, unicode):
+            try:
+                return value.encode(self.encoding or self.default_encoding)
+            except UnicodeError:
+                return value
+        return value
+
+    def stringify(self, obj):
+        """
+        ``obj`` as a string, the way str_compare() converts it.
+        """
+        if isinstance(obj, basestring):
+            return obj
+        if hasattr(obj, '__unicode__'):
+            return unicode(obj)
+        return str(obj)
+
     def write_marker(self, marker):
-        self._content.append((marker,))
+        if not self.markers.has_key(marker):
+            self.markers[marker] = (self.taken + len(self._content),
+                                    len(self.markers))
 
     def insert_at_marker(self, marker, text):
-        for i, item in enumerate(self._content):
-            if item == (marker,):
-                self._content.insert(i, text)
-                break
+        """
+        Inserts ``text`` where ``marker`` was first written (after
+        any text already inserted there), or at the very start if it
+        never was (before any text already inserted there).
+        """
+        place = self.markers.get(marker)
+        if place is None:
+            self.start_insertions.append(text)
         else:
-            self._content.insert(0, text)
+            self.insertions.setdefault(place, []).append(text)
+
+    def content_with_insertions(self):
+        """
+        The content, with the inserted texts in place.
+        """
+        content = self._content
+        if not self.insertions and not self.start_insertions:
+            return content
+        result = self.start_insertions[::-1]
+        places = self.insertions.keys()
+        places.sort()
+        start = 0
+        for place in places:
+            # Places count the content take_ready() took out too
+            position = place[0] - self.taken
+            result.extend(content[start:position])
+            result.extend(self.insertions[place])
+            start = position
+        result.extend(content[start:])
+        return result
+
+    def take_ready(self):
+        """
+        Takes the content that can't change any more (i.e., where no
+        unused error can be inserted any more) out of the parser, and
+        returns it as a string.
+        """
+        end = len(self._content)
+        if self.auto_error_formatter and not self.finished:
+            for key in self.errors.keys():
+                if self.used_errors.has_key(key):
+                    continue
+                place = self.markers.get(key)
+                if place is None:
+                    # It may have to go at the very start
+                    return ''
+                end = min(end, place[0] - self.taken)
+        if end <= 0:
+            return ''
+        ready = self._content[:end]
+        del self._content[:end]
+        self.taken += end
+        if self.encoding is not None and not self.finished:
+            for i in range(len(ready)):
+                if isinstance(ready[i], str):
+                    ready[i] = ready[i].decode(self.encoding)
+        return ''.join(ready)
+
+# Defaults made of these can be precomputed by selection_set():
+_simple_types = (basestring, bool, int, long, float)
 
 # This can potentially be extended globally
 default_formatter_dict = {'default': default_formatter,
@@ -530,3 +892,35 @@ default_formatter_dict = {'default': default_formatter,
                           'escapenl': escapenl_formatter,
                           'ignore': ignore_formatter,
                           }
+
+class _PlanFillingParser(FillingParser):
+
+    """
+    A `FillingParser` that is given its events by `FillPlan.fill`
+    instead of parsing.
+    """
+
+    event_pos = None
+    event_text = None
+    replay_events = ()
+
+    def feed(self, data):
+        raise TypeError("%s is filled by a FillPlan, not fed"
+                        % self.__class__.__name__)
+
+    def getpos(self):
+        return self.event_pos
+
+    def write_pos(self):
+        if self.skip_output():
+            return
+        if self.skip_next:
+            self.skip_next = False
+            return
+        self.write_text(self.event_text)
+
+    def goahead(self, end):
+        # Called by HTMLParser.close()
+        events = self.replay_events
+        self.replay_events = ()
+        _replay(self, events)
@@ -56,6 +56,12 @@ class IValidator(IDeclarative):
         representation.  `state` is for application-specific hooks.
         """
 
+    def validate(value, state=None):
+        """
+        Like `to_python`, but returns a `Result` (with ``value`` and
+        ``errors`` attributes) instead of raising `Invalid`.
+        """
+
     def message(name, default):
         """
         Return the message (from the `messages` attribute) that goes
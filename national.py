@@ -324,6 +324,7 @@ class CountryValidator(FancyValidator):
     """
 
     key_ok = True
+    pure = True
 
     messages = {
         'valueNotFound': _("That country is not listed in ISO 3166"),
@@ -377,6 +378,7 @@ class PostalCodeInCountryFormat(FancyValidator):
 
     country_field = 'country'
     zip_field = 'zip'
+    pure = True
     __unpackargs__ = ('country_field', 'zip_field')
     messages = {
         'badFormat': _("Given postal code does not match the country's format."),
@@ -387,40 +389,46 @@ class PostalCodeInCountryFormat(FancyValidator):
         'BE': FourDigitsPostalCode,
         'BG': FourDigitsPostalCode,
         'CA': CanadianPostalCode,
-        'CL': lambda: DelimitedDigitsPostalCode(7),
-        'CN': lambda: DelimitedDigitsPostalCode(6),
+        'CL': DelimitedDigitsPostalCode(7),
+        'CN': DelimitedDigitsPostalCode(6),
         'CR': FourDigitsPostalCode,
         'DE': GermanPostalCode,
         'DK': FourDigitsPostalCode,
-        'DO': lambda: DelimitedDigitsPostalCode(5),
-        'ES': lambda: DelimitedDigitsPostalCode(5),
-        'FI': lambda: DelimitedDigitsPostalCode(5),
-        'FR': lambda: DelimitedDigitsPostalCode(5),
+        'DO': DelimitedDigitsPostalCode(5),
+        'ES': DelimitedDigitsPostalCode(5),
+        'FI': DelimitedDigitsPostalCode(5),
+        'FR': DelimitedDigitsPostalCode(5),
         'GB': UKPostalCode,
-        'GF': lambda: DelimitedDigitsPostalCode(5),
-        'GR': lambda: DelimitedDigitsPostalCode([2, 3], ' '),
-        'HN': lambda: DelimitedDigitsPostalCode(5),
+        'GF': DelimitedDigitsPostalCode(5),
+        'GR': DelimitedDigitsPostalCode([2, 3], ' '),
+        'HN': DelimitedDigitsPostalCode(5),
         'HT': FourDigitsPostalCode,
         'HU': FourDigitsPostalCode,
-        'IS': lambda: DelimitedDigitsPostalCode(3),
-        'IT': lambda: DelimitedDigitsPostalCode(5),
-        'JP': lambda: DelimitedDigitsPostalCode([3, 4], '-'),
-        'KR': lambda: DelimitedDigitsPostalCode([3, 3], '-'),
+        'IS': DelimitedDigitsPostalCode(3),
+        'IT': DelimitedDigitsPostalCode(5),
+        'JP': DelimitedDigitsPostalCode([3, 4], '-'),
+        'KR': DelimitedDigitsPostalCode([3, 3], '-'),
         'LI': FourDigitsPostalCode,
         'LU': FourDigitsPostalCode,
-        'MC': lambda: DelimitedDigitsPostalCode(5),
-        'NI': lambda: DelimitedDigitsPostalCode([3, 3, 1], '-'),
+        'MC': DelimitedDigitsPostalCode(5),
+        'NI': DelimitedDigitsPostalCode([3, 3, 1], '-'),
         'NO': FourDigitsPostalCode,
         'PL': PolishPostalCode,
-        'PT': lambda: DelimitedDigitsPostalCode([4, 3], '-'),
+        'PT': DelimitedDigitsPostalCode([4, 3], '-'),
         'PY': FourDigitsPostalCode,
-        'RO': lambda: DelimitedDigitsPostalCode(6),
-        'SE': lambda: DelimitedDigitsPostalCode([3, 2], ' '),
-        'SG': lambda: DelimitedDigitsPostalCode(6),
+        'RO': DelimitedDigitsPostalCode(6),
+        'SE': DelimitedDigitsPostalCode([3, 2], ' '),
+        'SG': DelimitedDigitsPostalCode(6),
         'US': USPostalCode,
-        'UY': lambda: DelimitedDigitsPostalCode(5),
+        'UY': DelimitedDigitsPostalCode(5),
     }
 
+    def fields_read(self):
+        return [self.country_field, self.zip_field]
+
+    def fields_written(self):
+        return [self.zip_field]
+
     def validate_python(self, fields_dict, state):
         if fields_dict[self.country_field] in self._vd:
             try:
@@ -429,7 +437,7 @@ class PostalCodeInCountryFormat(FancyValidator):
             except Invalid, e:
                 message = self.message('badFormat', state)
                 raise Invalid(message, fields_dict, state,
-                              error_dict = {self.zip_field: e.message,
+                              error_dict = {self.zip_field: e.msg,
                                             self.country_field: message})
 
 class USStateProvince(FancyValidator):
@@ -612,6 +620,7 @@ class InternationalPhoneNumber(FancyValidator):
     strip = True
     # Use if there's a default country code you want to use:
     default_cc = None
+    pure = True
     _mark_chars_re = re.compile(r"[_.!~*'/]")
     _preTransformations = [
         (re.compile(r'^(\(?)(?:00\s*)(.+)$'), '%s+%s'),
@@ -708,6 +717,7 @@ class LanguageValidator(FancyValidator):
     """
 
     key_ok = True
+    pure = True
 
     messages = {
         'valueNotFound': _("That language is not listed in ISO 639"),
@@ -0,0 +1,110 @@
+"""
+Validates large batches of records on several processes.
+
+Validation is CPU-bound, so a big import only uses one core when it
+goes through `Schema.to_python_many`.  `ParallelValidator` splits the
+records into chunks, validates the chunks in a `multiprocessing` pool
+and gives back one `Result` per record, in the original order::
+
+    from formencode.parallel import ParallelValidator
+    validator = ParallelValidator(SignupSchema, chunksize=1000)
+    for index, result in enumerate(validator.to_python_many(rows)):
+        if result.errors is not None:
+            print 'Row %i: %s' % (index, result.errors)
+
+Each worker process gets its own copy of the validator (and of the
+state), pickled once when the pool starts, so both have to be
+picklable: validators (and the classes they are instances of) must
+be defined at module level.  The `Invalid` errors that come back have
+their messages rendered already and no ``state``.
+
+If `multiprocessing` isn't available (or ``processes`` is 1), the
+records are simply validated in this process.
+"""
+
+import itertools
+
+try:
+    import multiprocessing
+except ImportError:
+    multiprocessing = None
+
+import declarative
+
+__all__ = ['ParallelValidator']
+
+class ParallelValidator(declarative.Declarative):
+
+    """
+    Validates an iterable of records with ``validator`` (usually a
+    `Schema`) in a pool of ``processes`` worker processes (by default
+    one per CPU), ``chunksize`` records at a time.  At most
+    ``window`` chunks (by default, two per process) are in the pool at
+    once, so records aren't read much faster than they are validated.
+    """
+
+    validator = None
+    processes = None
+    chunksize = 500
+    window = None
+
+    __unpackargs__ = ('validator',)
+
+    def __initargs__(self, new_attrs):
+        if isinstance(self.validator, type):
+            self.validator = self.validator.singleton()
+
+    def to_python_many(self, values, state=None):
+        """
+        Yields a `Result` for each record in ``values``, in order.
+        Up to ``window`` chunks of records are read (and sent to the
+        workers) ahead of what has been yielded; results are yielded
+        as soon as each chunk in turn is done.
+        """
+        if multiprocessing is None or self.processes == 1:
+            for result in _validate_many(self.validator, values, state):
+                yield result
+            return
+        window = self.window
+        if window is None:
+            window = 2 * (self.processes or multiprocessing.cpu_count())
+        pool = multiprocessing.Pool(self.processes, _init_worker,
+                                    (self.validator, state))
+        try:
+            pending = []
+            for chunk in _chunks(values, self.chunksize):
+                pending.append(pool.apply_async(_validate_chunk, (chunk,)))
+                if len(pending) >= window:
+                    for result in pending.pop(0).get():
+                        yield result
+            while pending:
+                for result in pending.pop(0).get():
+                    yield result
+        finally:
+            pool.terminate()
+            pool.join()
+
+def _chunks(values, size):
+    values = iter(values)
+    while 1:
+        chunk = list(itertools.islice(values, size))
+        if not chunk:
+            break
+        yield chunk
+
+def _validate_many(validator, values, state):
+    if hasattr(validator, 'to_python_many'):
+        return validator.to_python_many(values, state)
+    return itertools.imap(lambda value: validator.validate(value, state),
+                          values)
+
+# The validator and state of this worker process, set by _init_worker:
+_worker_args = None
+
+def _init_worker(validator, state):
+    global _worker_args
+    _worker_args = (validator, state)
+
+def _validate_chunk(chunk):
+    validator, state = _worker_args
+    return list(_validate_many(validator, chunk, state))
@@ -0,0 +1,324 @@
+"""
+Caches for the results of a `Schema`.
+
+When a schema's validators are all pure (see ``Validator.pure``),
+validating the same dictionary twice gives the same result, so it can
+be cached -- handy when forms get submitted twice, or requests are
+retried.  Give the schema a ``result_cache``::
+
+    class Checkout(Schema):
+        ...
+        result_cache = MemoryResultCache(maxsize=5000)
+
+The cache is only used when the schema (and everything in it) is
+pure, and the input can be frozen (dictionaries, lists, strings,
+numbers...).  Converted values are copied on the way out, so callers
+can modify them; cached errors are raised again.  Results are keyed
+on the configuration of the schema (see `fingerprint`) and on the
+translation function, so schemas can share a cache, and so can
+requests that use different languages.
+
+A backend is anything with ``.get(key)`` (returning None when the key
+isn't there) and ``.set(key, value)``; keys are strings, and values
+are picklable.  There's an in-process LRU (`MemoryResultCache`), one
+that keeps the results in a `shelve` file (`ShelveResultCache`), so
+they outlive the process, and one that keeps them in an SQLite
+database (`SQLiteResultCache`), which several processes -- e.g., the
+workers of one server -- can share while they run.  A shelve file
+can't be shared by processes that are running at the same time.
+"""
+
+import os
+import shelve
+import time
+
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+try:
+    import threading
+except ImportError:
+    threading = None
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import sha as sha1
+
+from declarative import Declarative
+from util.lrucache import LRUCache
+
+__all__ = ['MemoryResultCache', 'ShelveResultCache', 'SQLiteResultCache',
+           'cache_key', 'fingerprint']
+
+def freeze(value):
+    """
+    Turns ``value`` into nested tuples of immutable values, with a
+    stable order (dictionaries and sets are sorted), raising
+    TypeError if it contains anything else.  Strings and numbers are
+    paired with their type, so values that are equal but of different
+    types (``1``, ``1.0`` and ``True``; ``'a'`` and ``u'a'``) don't
+    freeze to equal values.
+    """
+    if value is None:
+        return value
+    if isinstance(value, (basestring, bool, int, long, float)):
+        return (type(value).__name__, value)
+    if isinstance(value, dict):
+        items = [(freeze(key), freeze(item)) for key, item in value.items()]
+        items.sort()
+        return ('dict', tuple(items))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(map(freeze, value)))
+    if isinstance(value, (set, frozenset)):
+        items = map(freeze, value)
+        items.sort()
+        return ('set', tuple(items))
+    raise TypeError("Cannot freeze %r" % (value,))
+
+def cache_key(name, value):
+    """
+    A stable key for validating ``value`` with the validator called
+    ``name``; raises TypeError if ``value`` can't be frozen.
+    """
+    return sha1(repr((name, freeze(value)))).hexdigest()
+
+def fingerprint(obj):
+    """
+    A string that describes ``obj`` well enough to tell it from a
+    differently configured one: for a validator (or any other
+    `Declarative` object) that's its class and the attributes set on
+    it, with the validators it holds described the same way (caches
+    and other transient attributes are left out).  Other objects are
+    described by their ``repr()``.
+    """
+    if isinstance(obj, type):
+        return '%s.%s' % (obj.__module__, obj.__name__)
+    if isinstance(obj, Declarative):
+        transient = obj.__transientattributes__
+        attrs = ['%s=%s' % (name, fingerprint(value))
+                 for name, value in obj.__dict__.items()
+                 if name != 'declarative_count' and name not in transient]
+        attrs.sort()
+        return '%s(%s)' % (fingerprint(obj.__class__), ', '.join(attrs))
+    if isinstance(obj, (list, tuple)):
+        return '[%s]' % ', '.join(map(fingerprint, obj))
+    if isinstance(obj, dict):
+        items = ['%r: %s' % (key, fingerprint(value))
+                 for key, value in obj.items()]
+        items.sort()
+        return '{%s}' % ', '.join(items)
+    return repr(obj)
+
+def translator_key(trans):
+    """
+    Describes the translation function ``trans`` for cache keys: its
+    name and where it is defined, what a closure closes over, and for
+    a method of a `gettext` translation (which is what the standard
+    and builtin translators are), the headers of the catalog, which
+    name its language.
+    """
+    name = '%s.%s' % (getattr(trans, '__module__', None),
+                      getattr(trans, '__name__', None))
+    code = getattr(trans, 'func_code', None)
+    if code is not None:
+        name = '%s:%s' % (name, code.co_firstlineno)
+        if trans.func_closure:
+            return (name, tuple([repr(cell.cell_contents)
+                                 for cell in trans.func_closure]))
+    owner = getattr(trans, 'im_self', None)
+    if owner is None:
+        return name
+    info = getattr(owner, 'info', None)
+    if callable(info):
+        headers = info().items()
+        headers.sort()
+    else:
+        headers = []
+    return (name, owner.__class__.__name__, tuple(headers))
+
+class MemoryResultCache(object):
+
+    """
+    Keeps the ``maxsize`` most recently used results in this process.
+    """
+
+    def __init__(self, maxsize=1000, ttl=None):
+        self.cache = LRUCache(maxsize, ttl)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value):
+        self.cache.set(key, value)
+
+class ShelveResultCache(object):
+
+    """
+    Keeps results in the `shelve` file ``filename``, which only one
+    process may have open at a time (use `SQLiteResultCache` to share
+    results between processes).  When there are more than
+    ``maxsize`` of them, the least recently used tenth is dropped.
+    Which results were used recently is only tracked in memory, so
+    the results already in the file when it is opened all count as
+    the oldest.  Changes are written out by ``.sync()`` and
+    ``.close()`` (and whenever the `shelve` backend decides to).
+    """
+
+    def __init__(self, filename, maxsize=10000):
+        self.filename = filename
+        self.maxsize = maxsize
+        self.shelf = shelve.open(filename)
+        # When each key was last used, as a count of uses:
+        self.used = dict.fromkeys(self.shelf.keys(), 0)
+        self.clock = 0
+        if threading is None:
+            self._lock = None
+        else:
+            self._lock = threading.Lock()
+
+    def get(self, key):
+        self._acquire()
+        try:
+            if not self.used.has_key(key):
+                return None
+            self.clock += 1
+            self.used[key] = self.clock
+            return self.shelf[key]
+        finally:
+            self._release()
+
+    def set(self, key, value):
+        self._acquire()
+        try:
+            used = self.used
+            if not used.has_key(key) and len(used) >= self.maxsize:
+                entries = [(clock, k) for k, clock in used.items()]
+                entries.sort()
+                for clock, k in entries[:max(1, self.maxsize / 10)]:
+                    del self.shelf[k]
+                    del used[k]
+            self.shelf[key] = value
+            self.clock += 1
+            used[key] = self.clock
+        finally:
+            self._release()
+
+    def sync(self):
+        self._acquire()
+        try:
+            self.shelf.sync()
+        finally:
+            self._release()
+
+    def close(self):
+        self._acquire()
+        try:
+            self.shelf.close()
+        finally:
+            self._release()
+
+    def _acquire(self):
+        if self._lock is not None:
+            self._lock.acquire()
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
+
+class SQLiteResultCache(object):
+
+    """
+    Keeps results in the SQLite database ``filename``, which any
+    number of processes may use at once; SQLite locks the file for
+    each read and write, waiting up to ``timeout`` seconds for other
+    processes.  When there are more than ``maxsize`` results, the
+    least recently used tenth is dropped.  Each process connects the
+    first time it uses the cache, so a cache can be created before a
+    server forks its workers.  Changes are committed as they're made.
+
+    This needs the `sqlite3` module (standard since Python 2.5).
+    """
+
+    def __init__(self, filename, maxsize=10000, timeout=5.0):
+        assert sqlite3 is not None, (
+            "The sqlite3 module is required for SQLiteResultCache")
+        self.filename = filename
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._connection = None
+        self._pid = None
+        if threading is None:
+            self._lock = None
+        else:
+            self._lock = threading.Lock()
+
+    def get(self, key):
+        self._acquire()
+        try:
+            db = self._connect()
+            row = db.execute('SELECT value FROM results WHERE key = ?',
+                             (key,)).fetchone()
+            if row is None:
+                return None
+            db.execute('UPDATE results SET used = ? WHERE key = ?',
+                       (time.time(), key))
+            db.commit()
+            return pickle.loads(str(row[0]))
+        finally:
+            self._release()
+
+    def set(self, key, value):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        self._acquire()
+        try:
+            db = self._connect()
+            db.execute('INSERT OR REPLACE INTO results (key, value, used) '
+                       'VALUES (?, ?, ?)', (key, buffer(data), time.time()))
+            count = db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+            if count > self.maxsize:
+                db.execute('DELETE FROM results WHERE key IN '
+                           '(SELECT key FROM results ORDER BY used LIMIT ?)',
+                           (count - self.maxsize + self.maxsize / 10,))
+            db.commit()
+        finally:
+            self._release()
+
+    def close(self):
+        self._acquire()
+        try:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+        finally:
+            self._release()
+
+    def _connect(self):
+        # A connection can't be used by a forked child, so each
+        # process makes its own:
+        if self._connection is None or self._pid != os.getpid():
+            db = sqlite3.connect(self.filename, timeout=self.timeout,
+                                 check_same_thread=False)
+            db.execute('CREATE TABLE IF NOT EXISTS results '
+                       '(key TEXT PRIMARY KEY, value BLOB, used REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS results_used '
+                       'ON results (used)')
+            db.commit()
+            self._connection = db
+            self._pid = os.getpid()
+        return self._connection
+
+    def _acquire(self):
+        if self._lock is not None:
+            self._lock.acquire()
+
+    def _release(self):
+        if self._lock is not None:
+            self._lock.release()
@@ -17,6 +17,19 @@ def html_quote(v):
             v = str(v)
         return cgi.escape(v, 1)
 
+def line_starts(data):
+    """
+    The offset in ``data`` where each line starts.
+    """
+    starts = [0]
+    append = starts.append
+    find = data.find
+    pos = find('\n')
+    while pos != -1:
+        append(pos + 1)
+        pos = find('\n', pos + 1)
+    return starts
+
 class RewritingParser(HTMLParser.HTMLParser):
 
     listener = None
@@ -27,13 +40,32 @@ class RewritingParser(HTMLParser.HTMLParser):
         HTMLParser.HTMLParser.__init__(self)
 
     def feed(self, data):
+        self.start_source(data)
+        HTMLParser.HTMLParser.feed(self, data)
+
+    def feed_steps(self, data, size=16384):
+        """
+        Like ``.feed(data)``, but feeds ``data`` in pieces of about
+        ``size`` characters, yielding after each one.  Pieces end
+        before a ``<``, so an encoded character is never split.
+        """
+        self.start_source(data)
+        start = 0
+        while start < len(data):
+            end = data.find('<', start + size)
+            if end == -1:
+                end = len(data)
+            HTMLParser.HTMLParser.feed(self, data[start:end])
+            start = end
+            yield None
+
+    def start_source(self, data):
         self.data_is_str = isinstance(data, str)
         self.source = data
-        self.lines = data.split('\n')
+        self.line_starts = line_starts(data)
         self.source_pos = 1, 0
         if self.listener:
             self.listener.reset()
-        HTMLParser.HTMLParser.feed(self, data)
 
     _entityref_re = re.compile('&([a-zA-Z][-.a-zA-Z\d]*);')
     _charref_re = re.compile('&#(\d+|[xX][a-fA-F\d]+);')
@@ -82,26 +114,25 @@ class RewritingParser(HTMLParser.HTMLParser):
         return False
 
     def write_pos(self):
-        cur_line, cur_offset = self.getpos()
+        pos = self.getpos()
         if self.skip_output():
-            self.source_pos = self.getpos()
+            self.source_pos = pos
             return
         if self.skip_next:
             self.skip_next = False
-            self.source_pos = self.getpos()
+            self.source_pos = pos
             return
-        if cur_line == self.source_pos[0]:
-            self.write_text(
-                self.lines[cur_line-1][self.source_pos[1]:cur_offset])
-        else:
-            self.write_text(
-                self.lines[self.source_pos[0]-1][self.source_pos[1]:])
-            self.write_text('\n')
-            for i in range(self.source_pos[0]+1, cur_line):
-                self.write_text(self.lines[i-1])
-                self.write_text('\n')
-            self.write_text(self.lines[cur_line-1][:cur_offset])
-        self.source_pos = self.getpos()
+        self.write_text(self.source_text(self.source_pos, pos))
+        self.source_pos = pos
+
+    def source_text(self, start, end):
+        """
+        The source between two ``(line, offset)`` positions (as
+        returned by ``getpos()``).
+        """
+        line_starts = self.line_starts
+        return self.source[line_starts[start[0]-1] + start[1]:
+                           line_starts[end[0]-1] + end[1]]
 
     def write_text(self, text):
         self._content.append(text)
@@ -140,8 +171,7 @@ class RewritingParser(HTMLParser.HTMLParser):
 
     def _get_text(self):
         try:
-            return ''.join([
-                t for t in self._content if not isinstance(t, tuple)])
+            return ''.join(self._content)
         except UnicodeDecodeError, e:
             if self.data_is_str:
                 e.reason += (
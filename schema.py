@@ -1,10 +1,42 @@
 from interfaces import *
 from api import *
-from api import _
+from api import _, LazyMessage, _cost_of, _pure_of, _reissue
+from compound import Memoize
+from resultcache import cache_key, fingerprint, translator_key
+import bisect
+import copy
 import declarative
 
 __all__ = ['Schema']
 
+# The Schema attributes a SchemaPlan is built from; assigning one of
+# these makes the plan stale:
+_plan_settings = frozenset([
+    'allow_extra_fields', 'filter_extra_fields', 'if_key_missing',
+    'ignore_key_missing', 'skip_expensive_on_error', 'expensive_cost',
+    'track_dependencies', 'memoize_pure', 'memoize_size', 'pure',
+    '_pure'])
+
+# Bumped whenever a plan setting is assigned on a Schema class, since
+# every instance that inherits the setting has to rebuild its plan:
+_class_settings_version = 0
+
+class SchemaMeta(declarative.DeclarativeMeta):
+
+    def __setattr__(cls, name, value):
+        declarative.DeclarativeMeta.__setattr__(cls, name, value)
+        if name in _plan_settings:
+            _class_settings_changed()
+
+    def __delattr__(cls, name):
+        declarative.DeclarativeMeta.__delattr__(cls, name)
+        if name in _plan_settings:
+            _class_settings_changed()
+
+def _class_settings_changed():
+    global _class_settings_version
+    _class_settings_version += 1
+
 class Schema(FancyValidator):
 
     """
@@ -33,6 +65,13 @@ class Schema(FancyValidator):
     fields can have the 'missing' message set to specify the error
     message, or if that does not exist the *schema* message
     'missingValue' is used.
+
+    Fields are validated cheapest first, going by the validators'
+    ``cost`` (e.g., ``Email(resolve_domain=True)`` is expensive).  With
+    skip_expensive_on_error=True, fields whose cost is at least
+    expensive_cost aren't validated at all once another field has
+    failed; the errors for the fields that were validated are the
+    same.
     """
 
     # These validators will be applied before this schema:
@@ -53,6 +92,29 @@ class Schema(FancyValidator):
     # If true, then missing keys will be missing in the result,
     # if the validator doesn't have if_missing on it already:
     ignore_key_missing = False
+    # If true, stop at the first error: the remaining fields, the
+    # partial validators and the chained validators aren't run, and
+    # the error only includes that one field.  A ``fail_fast``
+    # attribute on the state overrides this for a single call:
+    fail_fast = False
+    # If true, then once a field has an error, fields with a cost of
+    # expensive_cost or more are skipped:
+    skip_expensive_on_error = False
+    expensive_cost = 100
+    # If true, use the fields_read() and fields_written() of the
+    # chained validators: when some fields are invalid, chained
+    # validators that only read valid fields still run (and partial
+    # validators that read invalid fields don't), and when a chained
+    # validator fails, the ones that don't depend on it still run:
+    track_dependencies = False
+    # If true, fields whose validators are pure (see Validator.pure)
+    # get their results cached, up to memoize_size values each (see
+    # compound.Memoize):
+    memoize_pure = False
+    memoize_size = 1000
+    # A cache for whole results (see the resultcache module); it is
+    # only used if the schema is pure:
+    result_cache = None
     compound = True
     fields = {}
     order = []
@@ -66,6 +128,21 @@ class Schema(FancyValidator):
     __mutableattributes__ = ('fields', 'chained_validators',
                              'pre_validators')
 
+    __singletonmethods__ = FancyValidator.__singletonmethods__ + (
+        'compile', 'to_python_many', 'revalidate', 'derive')
+
+    __transientattributes__ = ('_plan', 'result_cache')
+
+    __metaclass__ = SchemaMeta
+
+    # The compiled `SchemaPlan`, built lazily by .compile():
+    _plan = None
+    # An explicit cost; by default it's the cost of all the validators:
+    _cost = None
+    # Explicitly pure or not; by default it's pure if all the
+    # validators are:
+    _pure = None
+
     def __classinit__(cls, new_attrs):
         FancyValidator.__classinit__(cls, new_attrs)
         # Don't bother doing anything if this is the most parent
@@ -91,6 +168,8 @@ class Schema(FancyValidator):
             cls.add_field(name, value)
 
     def __initargs__(self, new_attrs):
+        # Any plan copied over from another instance may be stale:
+        self._plan = None
         for key, value in new_attrs.items():
             if key in ('pre_validators', 'chained_validators',
                        'view'):
@@ -105,6 +184,16 @@ class Schema(FancyValidator):
         for name, value in self.fields.items():
             self.add_field(name, value)
     
+    def __setattr__(self, name, value):
+        FancyValidator.__setattr__(self, name, value)
+        if name in _plan_settings:
+            self._plan = None
+
+    def __delattr__(self, name):
+        FancyValidator.__delattr__(self, name)
+        if name in _plan_settings:
+            self._plan = None
+
     def assert_dict(self, value, state):
         """
         Helper to assure we have proper input
@@ -113,101 +202,448 @@ class Schema(FancyValidator):
             # Not a dict or dict-like object
             raise Invalid(self.message('badDictType', state, type=type(value), value=value),
                           value, state)
-            
+
+    def compile(self):
+        """
+        Precomputes the `SchemaPlan` used by ``.to_python()`` and
+        ``.from_python()``, and returns it.
+
+        This happens automatically on first use, and again after a
+        setting like ``allow_extra_fields`` is assigned (on the schema
+        or its class); you only need to call this yourself if you
+        modify ``fields``, ``pre_validators`` or ``chained_validators``
+        in place (the ``add_*`` methods take care of this for you).
+        """
+        self._plan = SchemaPlan(self)
+        return self._plan
+
+    def _get_plan(self):
+        plan = self._plan
+        if (plan is None
+            or plan.settings_version != _class_settings_version):
+            plan = self.compile()
+        return plan
+
+    def derive(self, add=None, remove=()):
+        """
+        Returns a variant of this schema with the fields in ``add`` (a
+        dictionary of name: validator) added or replaced, and the
+        fields named in ``remove`` removed::
+
+            schema = SignupSchema.derive(add={'coupon': Coupon()},
+                                         remove=['referrer'])
+
+        Unlike subclassing or calling the schema, nothing is rebuilt
+        field by field: the variant shares the other validators (and
+        the ``memoize_pure`` caches) with this schema, and its plan is
+        this schema's plan patched with the changes, so it's cheap
+        enough to do for each request.  Changing either schema
+        afterwards doesn't affect the other.
+
+        The variant doesn't use this schema's ``result_cache``, as its
+        results are different.
+        """
+        if add is None:
+            add = {}
+        plan = self._get_plan()
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new.fields = fields = self.fields.copy()
+        for name in remove:
+            if fields.has_key(name):
+                del fields[name]
+        fields.update(add)
+        new.pre_validators = self.pre_validators[:]
+        new.chained_validators = self.chained_validators[:]
+        if self.result_cache is not None:
+            new.result_cache = None
+        new._plan = plan.derive(new, add, remove)
+        return new
+
+    def _invalidate_plan(self, cls):
+        if self is not None:
+            self._plan = None
+        else:
+            singleton = cls.__dict__.get('_%s__singleton' % cls.__name__)
+            if singleton is not None:
+                singleton._plan = None
+
+    _invalidate_plan = declarative.classinstancemethod(_invalidate_plan)
+
+    def to_python_many(self, values, state=None, compact_errors=True):
+        """
+        Validates each dictionary in ``values`` (any iterable), and
+        yields a `Result` for each one, in order -- the converted
+        dictionary, or the errors for that row.  Nothing is raised
+        for invalid rows, and nothing is kept between rows, so this
+        can be used on very long streams of records.
+
+        The plan is compiled and the translator is bound to ``state``
+        (see `bind_translator`) once for the whole batch, instead of
+        for every record, if all the validators use the same one; it
+        is unbound again once the batch is done.
+        The same ``state`` is used for every row.
+
+        Unless ``compact_errors`` is false, the errors are compacted
+        (see `Invalid.compact`): they don't keep the state, or the
+        values of the invalid fields.
+        """
+        results = self._to_python_many(values, state)
+        if not compact_errors:
+            return results
+        return _compact_results(results)
+
+    def _to_python_many(self, values, state):
+        self._get_plan()
+        bound = False
+        if state is not None and not hasattr(state, '_'):
+            translator = self._common_translator(state)
+            if translator is not None:
+                bind_translator(state, translator)
+                bound = True
+        try:
+            if (self._has_native_validate and self._has_native_to_python
+                and not self._has_validate_other
+                and not self._has_validate_python
+                and self.if_invalid is NoDefault
+                and (self.__class__.is_empty.im_func
+                     is Schema.is_empty.im_func)):
+                # Skip the generic FancyValidator steps; with nothing
+                # to do between them, they'd only cost time per row:
+                convert = self._to_python_result
+                for value_dict in values:
+                    if hasattr(value_dict, 'mixed'):
+                        value_dict = value_dict.mixed()
+                    yield convert(value_dict, state)
+            else:
+                validate = self.validate
+                for value_dict in values:
+                    yield validate(value_dict, state)
+        finally:
+            if bound:
+                try:
+                    del state._
+                except AttributeError:
+                    pass
+
+    def _common_translator(self, state):
+        """
+        The translator that this schema and every validator in it
+        would use with ``state``, or None if they don't all use the
+        same one (e.g., one has ``use_builtins_gettext`` off): binding
+        it to the state then would change some of the messages.
+        """
+        translator = self.get_translator(state)
+        pending = self.subvalidators()
+        seen = {}
+        while pending:
+            validator = pending.pop()
+            if isinstance(validator, type):
+                validator = validator.singleton()
+            if seen.has_key(id(validator)):
+                continue
+            seen[id(validator)] = validator
+            if validator.get_translator(state) != translator:
+                return None
+            pending.extend(validator.subvalidators())
+        return translator
+
+    def revalidate(self, previous, value_dict, state=None):
+        """
+        Validates ``value_dict`` like ``.validate()`` does, but reuses
+        what it can from ``previous`` (a `Result` returned by this
+        method; anything else, like None, means there's nothing to
+        reuse).  This is meant for validating the same form over and
+        over as it is edited::
+
+            result = MySchema.revalidate(None, form)
+            ...
+            result = MySchema.revalidate(result, changed_form)
+
+        Fields whose value hasn't changed keep their previous outcome,
+        and so do partial and chained validators whose
+        ``fields_read()`` haven't changed.  This assumes the field
+        validators only depend on their own value.
+        """
+        if not self._has_native_to_python:
+            return self.validate(value_dict, state)
+        plan = self._get_plan()
+        previous_memo = getattr(previous, 'memo', None)
+        if (not isinstance(previous_memo, SchemaMemo)
+            or previous_memo.plan is not plan):
+            previous_memo = None
+        memo = SchemaMemo(plan, previous_memo)
+        if hasattr(value_dict, 'mixed'):
+            value_dict = value_dict.mixed()
+        result = None
+        if self._has_validate_other:
+            try:
+                self.validate_other(value_dict, state)
+            except Invalid, e:
+                result = Result(value_dict, e)
+        if result is None:
+            result = self._validate_dict(value_dict, state,
+                                         memo, previous_memo)
+            if result.errors is None and self._has_validate_python:
+                try:
+                    self.validate_python(result.value, state)
+                except Invalid, e:
+                    result = Result(value_dict, e)
+        if result.errors is not None and self.if_invalid is not NoDefault:
+            result = Result(self.if_invalid)
+        result.memo = memo
+        return result
+
     def _to_python(self, value_dict, state):
+        result = self._to_python_result(value_dict, state)
+        if result.errors is not None:
+            raise result.errors
+        return result.value
+
+    def _to_python_result(self, value_dict, state):
+        if self.result_cache is not None:
+            plan = self._get_plan()
+            if plan.pure:
+                return self._cached_result(plan, value_dict, state)
+        return self._validate_dict(value_dict, state)
+
+    def _cached_result(self, plan, value_dict, state):
+        if plan.cache_name is None:
+            # Covers everything the results depend on besides the
+            # input (and the translator), so differently configured
+            # schemas don't get each other's results:
+            settings = [(name, getattr(self, name))
+                        for name in _plan_settings]
+            settings.sort()
+            plan.cache_name = fingerprint(
+                (settings, self.fields, self.pre_validators,
+                 self.chained_validators, self))
+        try:
+            key = cache_key(
+                (plan.cache_name,
+                 translator_key(self.get_translator(state))),
+                value_dict)
+        except TypeError:
+            return self._validate_dict(value_dict, state)
+        cached = self.result_cache.get(key)
+        if cached is None:
+            result = self._validate_dict(value_dict, state)
+            if result.errors is None:
+                self.result_cache.set(
+                    key, (copy.deepcopy(result.value), None))
+                return result
+            # Keep no state (and no lazy message) anywhere in the
+            # error; the errors given back are made from this copy
+            # whether it came from the cache or not, so they're the
+            # same either way:
+            cached = (None, result.errors.compact())
+            self.result_cache.set(key, cached)
+        value, errors = cached
+        if errors is not None:
+            return Result(value_dict, _reissue(errors, value_dict, state))
+        return Result(copy.deepcopy(value))
+
+    def _validate_dict(self, value_dict, state, memo=None,
+                       previous_memo=None):
         if not value_dict:
             if self.if_empty is not NoDefault:
-                return self.if_empty
+                return Result(self.if_empty)
             else:
                 value_dict = {}
 
-        for validator in self.pre_validators:
-            value_dict = validator.to_python(value_dict, state)
+        plan = self._get_plan()
+        for validator in plan.pre_validators:
+            result = validator.validate(value_dict, state)
+            if result.errors is not None:
+                return result
+            value_dict = result.value
 
-        self.assert_dict(value_dict, state)
-        
+        try:
+            self.assert_dict(value_dict, state)
+        except Invalid, e:
+            return Result(value_dict, e)
+
+        fields = plan.fields
+        fail_fast = getattr(state, 'fail_fast', self.fail_fast)
+        skip_expensive = plan.skip_expensive
         new = {}
         errors = {}
-        unused = self.fields.keys()
+        seen = {}
+        if plan.by_cost is None:
+            items = value_dict.items()
+        else:
+            # Extra fields first (they may make the whole thing
+            # invalid), then the fields from cheapest to most expensive:
+            items = [(name, value) for name, value in value_dict.items()
+                     if name not in fields]
+            items.extend([(name, value_dict[name]) for name in plan.by_cost
+                          if name in value_dict])
         if state is not None:
             previous_key = getattr(state, 'key', None)
             previous_full_dict = getattr(state, 'full_dict', None)
             state.full_dict = value_dict
         try:
-            for name, value in value_dict.items():
+            for name, value in items:
                 try:
-                    unused.remove(name)
-                except ValueError:
-                    if not self.allow_extra_fields:
-                        raise Invalid(
-                            self.message('notExpected', state,
-                                         name=repr(name)),
-                            value_dict, state)
+                    validator = fields[name]
+                except KeyError:
+                    if not plan.allow_extra_fields:
+                        return Result(value_dict, Invalid(
+                            self.lazy_message('notExpected', state,
+                                              name=repr(name)),
+                            value_dict, state))
                     else:
-                        if not self.filter_extra_fields:
+                        if not plan.filter_extra_fields:
                             new[name] = value
                         continue
-                validator = self.fields[name]
+                seen[name] = None
+                if errors and skip_expensive and name in plan.expensive_fields:
+                    continue
 
-                try:
-                    new[name] = validator.to_python(value, state)
-                except Invalid, e:
-                    errors[name] = e
+                if memo is None:
+                    result = validator.validate(value, state)
+                else:
+                    result = memo.validate_field(name, validator, value,
+                                                 state, previous_memo)
+                if result.errors is None:
+                    new[name] = result.value
+                else:
+                    errors[name] = result.errors
+                    if fail_fast:
+                        break
 
-            for name in unused:
-                validator = self.fields[name]
-                try:
-                    if_missing = validator.if_missing
-                except AttributeError:
-                    if_missing = NoDefault
-                if if_missing is NoDefault:
-                    if self.ignore_key_missing:
+            if len(seen) < len(fields):
+                for name, validator, if_missing, missing_message in \
+                        plan.missing_entries:
+                    if errors and fail_fast:
+                        break
+                    if name in seen:
                         continue
-                    if self.if_key_missing is NoDefault:
-                        try:
-                            message = validator.message('missing', state)
-                        except KeyError:
-                            message = self.message('missingValue', state)
-                        errors[name] = Invalid(message, None, state)
+                    if if_missing is NoDefault:
+                        if plan.ignore_key_missing:
+                            continue
+                        if plan.if_key_missing is NoDefault:
+                            if missing_message:
+                                message = validator.lazy_message(
+                                    'missing', state)
+                            else:
+                                message = self.lazy_message(
+                                    'missingValue', state)
+                            errors[name] = Invalid(message, None, state)
+                        elif (errors and skip_expensive
+                              and name in plan.expensive_fields):
+                            continue
+                        else:
+                            result = validator.validate(
+                                plan.if_key_missing, state)
+                            if result.errors is None:
+                                new[name] = result.value
+                            else:
+                                errors[name] = result.errors
                     else:
-                        try:
-                            new[name] = validator.to_python(self.if_key_missing, state)
-                        except Invalid, e:
-                            errors[name] = e
-                else:
-                    new[name] = validator.if_missing
+                        new[name] = if_missing
 
-            for validator in self.chained_validators:
-                if (not hasattr(validator, 'validate_partial')
-                    or not getattr(validator, 'validate_partial_form', False)):
+            for index, validator in enumerate(plan.partial_validators):
+                if errors and fail_fast:
+                    break
+                if (plan.track_dependencies and errors
+                    and plan.partial_reads[index] is not None
+                    and reads_any(plan.partial_reads[index], errors)):
                     continue
-                try:
-                    validator.validate_partial(value_dict, state)
-                except Invalid, e:
-                    sub_errors = e.unpack_errors()
-                    if not isinstance(sub_errors, dict):
-                        # Can't do anything here
-                        continue
+                if memo is None:
+                    sub_errors = partial_errors(validator, value_dict, state)
+                else:
+                    sub_errors = memo.partial_errors(
+                        index, validator, value_dict, state, previous_memo)
+                if sub_errors:
                     merge_dicts(errors, sub_errors)
 
+            if plan.track_dependencies and not (errors and fail_fast):
+                return self._chain_by_dependencies(
+                    plan, value_dict, new, errors, state,
+                    memo, previous_memo)
+
             if errors:
-                raise Invalid(
-                    format_compound_error(errors),
+                return Result(value_dict, Invalid(
+                    LazyMessage(format_compound_error, errors),
                     value_dict, state,
-                    error_dict=errors)
+                    error_dict=errors))
 
-            for validator in self.chained_validators:
-                new = validator.to_python(new, state)
+            for index, validator in enumerate(plan.chained_validators):
+                if memo is None:
+                    result = validator.validate(new, state)
+                else:
+                    result = memo.validate_chained(
+                        index, validator, new, state, previous_memo)
+                if result.errors is not None:
+                    return Result(value_dict, result.errors)
+                new = result.value
 
-            return new
+            return Result(new)
 
         finally:
             if state is not None:
                 state.key = previous_key
                 state.full_dict = previous_full_dict
 
+    def _chain_by_dependencies(self, plan, value_dict, new, errors, state,
+                               memo, previous_memo):
+        """
+        Runs the chained validators over ``new`` when
+        ``track_dependencies`` is on, skipping those that read a field
+        that is invalid, or that was written by a validator that
+        failed or was skipped.  Validators that don't say what they
+        read are only run when everything so far is valid.
+        """
+        fail_fast = getattr(state, 'fail_fast', self.fail_fast)
+        # Fields we can't rely on:
+        broken = dict.fromkeys(errors.keys())
+        chain_errors = []
+        for index, validator in enumerate(plan.chained_validators):
+            reads = plan.chained_reads[index]
+            writes = plan.chained_writes[index]
+            if reads is None:
+                skip = errors or chain_errors
+            elif validator in plan.partial_validators and errors:
+                # Already had its say, with validate_partial
+                skip = True
+            else:
+                skip = reads_any(reads, broken)
+            if skip:
+                if writes is None:
+                    break
+                broken.update(dict.fromkeys(writes))
+                continue
+            if memo is None:
+                result = validator.validate(new, state)
+            else:
+                result = memo.validate_chained(
+                    index, validator, new, state, previous_memo)
+            if result.errors is None:
+                new = result.value
+                continue
+            chain_errors.append(result.errors)
+            if writes is None or fail_fast:
+                break
+            broken.update(dict.fromkeys(writes))
+        if not errors and not chain_errors:
+            return Result(new)
+        if not errors and len(chain_errors) == 1:
+            return Result(value_dict, chain_errors[0])
+        errors = errors.copy()
+        for error in chain_errors:
+            sub_errors = error.unpack_errors()
+            if not isinstance(sub_errors, dict):
+                sub_errors = {'form': sub_errors}
+            merge_dicts(errors, sub_errors)
+        return Result(value_dict, Invalid(
+            LazyMessage(format_compound_error, errors),
+            value_dict, state,
+            error_dict=errors))
+
     def _from_python(self, value_dict, state):
-        chained = self.chained_validators[:]
+        plan = self._get_plan()
+        chained = list(plan.chained_validators)
         chained.reverse()
         finished = []
         for validator in chained:
@@ -215,9 +651,10 @@ class Schema(FancyValidator):
             finished.append(validator)
             value_dict = validator.from_python(value_dict, state)
         self.assert_dict(value_dict, state)
+        fields = plan.fields
         new = {}
         errors = {}
-        unused = self.fields.keys()
+        seen = {}
         if state is not None:
             previous_key = getattr(state, 'key', None)
             previous_full_dict = getattr(state, 'full_dict', None)
@@ -227,25 +664,28 @@ class Schema(FancyValidator):
             for name, value in value_dict.items():
                 __traceback_info__ = 'for_python in %s' % name
                 try:
-                    unused.remove(name)
-                except ValueError:
-                    if not self.allow_extra_fields:
+                    validator = fields[name]
+                except KeyError:
+                    if not plan.allow_extra_fields:
                         raise Invalid(
                             self.message('notExpected', state,
                                          name=repr(name)),
                             value_dict, state)
-                    if not self.filter_extra_fields:
+                    if not plan.filter_extra_fields:
                         new[name] = value
                 else:
+                    seen[name] = None
                     try:
-                        new[name] = self.fields[name].from_python(value, state)
+                        new[name] = validator.from_python(value, state)
                     except Invalid, e:
                         errors[name] = e
 
             del __traceback_info__
 
-            for name in unused:
-                validator = self.fields[name]
+            for name, validator, if_missing, missing_message in \
+                    plan.missing_entries:
+                if name in seen:
+                    continue
                 try:
                     new[name] = validator.from_python(None, state)
                 except Invalid, e:
@@ -253,11 +693,11 @@ class Schema(FancyValidator):
 
             if errors:
                 raise Invalid(
-                    format_compound_error(errors),
+                    LazyMessage(format_compound_error, errors),
                     value_dict, state,
                     error_dict=errors)
 
-            pre = self.pre_validators[:]
+            pre = list(plan.pre_validators)
             pre.reverse()
             for validator in pre:
                 __traceback_info__ = 'for_python pre_validator %s' % validator
@@ -274,10 +714,12 @@ class Schema(FancyValidator):
 
     def add_chained_validator(self, cls, validator):
         if self is not None:
+            self._invalidate_plan()
             if self.chained_validators is cls.chained_validators:
                 self.chained_validators = cls.chained_validators[:]
             self.chained_validators.append(validator)
         else:
+            cls._invalidate_plan()
             cls.chained_validators.append(validator)
 
     add_chained_validator = declarative.classinstancemethod(
@@ -285,20 +727,24 @@ class Schema(FancyValidator):
 
     def add_field(self, cls, name, validator):
         if self is not None:
+            self._invalidate_plan()
             if self.fields is cls.fields:
                 self.fields = cls.fields.copy()
             self.fields[name] = validator
         else:
+            cls._invalidate_plan()
             cls.fields[name] = validator
 
     add_field = declarative.classinstancemethod(add_field)
 
     def add_pre_validator(self, cls, validator):
         if self is not None:
+            self._invalidate_plan()
             if self.pre_validators is cls.pre_validators:
                 self.pre_validators = cls.pre_validators[:]
             self.pre_validators.append(validator)
         else:
+            cls._invalidate_plan()
             cls.pre_validators.append(validator)
 
     add_pre_validator = declarative.classinstancemethod(add_pre_validator)
@@ -310,6 +756,29 @@ class Schema(FancyValidator):
         result.extend(self.fields.values())
         return result
 
+    def cost__get(self):
+        if self._cost is not None:
+            return self._cost
+        return max(1, sum([_cost_of(v) for v in self.subvalidators()]))
+
+    def cost__set(self, value):
+        self._cost = value
+
+    cost = property(cost__get, cost__set)
+
+    def pure__get(self):
+        if self._pure is not None:
+            return self._pure
+        for validator in self.subvalidators():
+            if not _pure_of(validator):
+                return False
+        return True
+
+    def pure__set(self, value):
+        self._pure = value
+
+    pure = property(pure__get, pure__set)
+
     def is_empty(self, value):
         ## Generally nothing is empty for us
         return False
@@ -317,6 +786,312 @@ class Schema(FancyValidator):
     def empty_value(self, value):
         return {}
 
+def _compact_results(results):
+    for result in results:
+        if result.errors is not None:
+            result.errors = result.errors.compact()
+        yield result
+
+class SchemaPlan(object):
+
+    """
+    The precomputed bookkeeping a `Schema` needs to validate a
+    dictionary: the field validators, how each missing field is
+    handled, the order to validate fields in (``by_cost`` is None
+    when they all cost the same, and any order will do), which
+    chained validators can validate a partial form, and the policy
+    for extra and missing keys.
+
+    Plans are built by ``Schema.compile()`` and shouldn't be modified;
+    build a new one instead.
+    """
+
+    def __init__(self, schema):
+        self.fields = {}
+        for name, validator in schema.fields.items():
+            self.fields[name] = self._field_validator(schema, validator)
+        missing_entries = []
+        required = []
+        optional = []
+        for name, validator in self.fields.items():
+            entry = self._missing_entry(name, validator)
+            if entry[2] is NoDefault:
+                required.append(name)
+            else:
+                optional.append(name)
+            missing_entries.append(entry)
+        self.missing_entries = tuple(missing_entries)
+        self.required_fields = frozenset(required)
+        self.optional_fields = frozenset(optional)
+        costs = {}
+        for name, validator in self.fields.items():
+            costs[name] = _cost_of(validator)
+        self.costs = costs
+        # (cost, name) for every field, sorted; kept so derive() can
+        # patch the order instead of sorting again:
+        self._cost_order = [(cost, name) for name, cost in costs.items()]
+        self._cost_order.sort()
+        self._set_by_cost()
+        self.skip_expensive = schema.skip_expensive_on_error
+        self.expensive_fields = frozenset([
+            name for name, cost in costs.items()
+            if cost >= schema.expensive_cost])
+        self.pre_validators = tuple(schema.pre_validators)
+        self.chained_validators = tuple(schema.chained_validators)
+        self.partial_validators = tuple([
+            validator for validator in schema.chained_validators
+            if hasattr(validator, 'validate_partial')
+            and getattr(validator, 'validate_partial_form', False)])
+        self.partial_reads = tuple(map(fields_read,
+                                       self.partial_validators))
+        self.chained_reads = tuple(map(fields_read,
+                                       self.chained_validators))
+        self.chained_writes = tuple(map(fields_written,
+                                        self.chained_validators))
+        self.track_dependencies = schema.track_dependencies
+        self.pure = schema.pure
+        self.allow_extra_fields = schema.allow_extra_fields
+        self.filter_extra_fields = schema.filter_extra_fields
+        self.if_key_missing = schema.if_key_missing
+        self.ignore_key_missing = schema.ignore_key_missing
+        self.settings_version = _class_settings_version
+        # The name the schema's results are cached under (see
+        # Schema._cached_result):
+        self.cache_name = None
+
+    def _field_validator(self, schema, validator):
+        if schema.memoize_pure and _pure_of(validator):
+            return Memoize(validator, maxsize=schema.memoize_size)
+        return validator
+
+    def _missing_entry(self, name, validator):
+        try:
+            if_missing = validator.if_missing
+        except AttributeError:
+            if_missing = NoDefault
+        missing_message = 'missing' in getattr(validator, '_messages', {})
+        return (name, validator, if_missing, missing_message)
+
+    def _set_by_cost(self):
+        order = self._cost_order
+        if order and order[0][0] != order[-1][0]:
+            self.by_cost = tuple([name for cost, name in order])
+        else:
+            self.by_cost = None
+
+    def derive(self, schema, add, remove):
+        """
+        A copy of this plan for ``schema`` (see `Schema.derive`), with
+        the fields in ``add`` added or replaced and the ones in
+        ``remove`` removed.  Only the changed fields are looked at.
+        """
+        plan = object.__new__(self.__class__)
+        plan.__dict__.update(self.__dict__)
+        plan.fields = fields = self.fields.copy()
+        plan.costs = costs = self.costs.copy()
+        plan._cost_order = order = self._cost_order[:]
+        dropped = {}
+        for name in list(remove) + add.keys():
+            if fields.has_key(name) and not dropped.has_key(name):
+                dropped[name] = fields.pop(name)
+                del order[bisect.bisect_left(order, (costs.pop(name), name))]
+        entries = []
+        required = []
+        for name, validator in add.items():
+            validator = self._field_validator(schema, validator)
+            fields[name] = validator
+            costs[name] = cost = _cost_of(validator)
+            bisect.insort(order, (cost, name))
+            entry = self._missing_entry(name, validator)
+            if entry[2] is NoDefault:
+                required.append(name)
+            entries.append(entry)
+        missing_entries = self.missing_entries
+        if dropped:
+            missing_entries = tuple([
+                entry for entry in missing_entries
+                if not dropped.has_key(entry[0])])
+        plan.missing_entries = missing_entries + tuple(entries)
+        added = frozenset(add.keys())
+        changed = frozenset(dropped.keys()) | added
+        required = frozenset(required)
+        plan.required_fields = (self.required_fields - changed) | required
+        plan.optional_fields = ((self.optional_fields - changed)
+                                | (added - required))
+        plan._set_by_cost()
+        plan.cache_name = None
+        plan.expensive_fields = (self.expensive_fields - changed) | frozenset([
+            name for name in added if costs[name] >= schema.expensive_cost])
+        if schema._pure is not None:
+            plan.pure = schema._pure
+        elif self.pure or not dropped:
+            plan.pure = self.pure
+            for validator in add.values():
+                if not _pure_of(validator):
+                    plan.pure = False
+                    break
+        else:
+            # An impure field may have been removed:
+            plan.pure = schema.pure
+        return plan
+
+    def __repr__(self):
+        return '<%s fields=%i required=%i partial=%i>' % (
+            self.__class__.__name__, len(self.fields),
+            len(self.required_fields), len(self.partial_validators))
+
+class SchemaMemo(object):
+
+    """
+    What `Schema.revalidate` remembers for the next run: the input
+    and `Result` of each field, and the values the partial and chained
+    validators read, with their outcome.  Entries from ``previous``
+    are carried over (they're only reused when the input matches), so
+    a validator that was skipped this time isn't forgotten.
+    """
+
+    def __init__(self, plan, previous=None):
+        self.plan = plan
+        if previous is None:
+            self.fields = {}
+            self.partial = {}
+            self.chained = {}
+        else:
+            self.fields = previous.fields.copy()
+            self.partial = previous.partial.copy()
+            self.chained = previous.chained.copy()
+
+    def validate_field(self, name, validator, value, state, previous):
+        if previous is not None and name in previous.fields:
+            previous_value, result = previous.fields[name]
+            if not same_value(previous_value, value):
+                result = validator.validate(value, state)
+        else:
+            result = validator.validate(value, state)
+        self.fields[name] = (value, result)
+        return result
+
+    def partial_errors(self, index, validator, value_dict, state, previous):
+        reads = self.plan.partial_reads[index]
+        if reads is None:
+            return partial_errors(validator, value_dict, state)
+        inputs = field_values(value_dict, reads)
+        if (previous is not None and index in previous.partial
+            and same_value(previous.partial[index][0], inputs)):
+            sub_errors = previous.partial[index][1]
+        else:
+            sub_errors = partial_errors(validator, value_dict, state)
+        self.partial[index] = (inputs, sub_errors)
+        return sub_errors
+
+    def validate_chained(self, index, validator, new, state, previous):
+        reads = self.plan.chained_reads[index]
+        if reads is None:
+            return validator.validate(new, state)
+        inputs = field_values(new, reads)
+        if (previous is not None and index in previous.chained
+            and same_value(previous.chained[index][0], inputs)):
+            entry = self.chained[index] = previous.chained[index]
+            outputs, errors = entry[1], entry[2]
+            if errors is not None:
+                return Result(new, errors)
+            for name, value in zip(reads, outputs):
+                if value is NoDefault:
+                    if new.has_key(name):
+                        del new[name]
+                else:
+                    new[name] = value
+            return Result(new)
+        result = validator.validate(new, state)
+        if result.value is new:
+            # It worked in place, and (by the contract of
+            # fields_read()) only on these fields, so it can be
+            # replayed:
+            self.chained[index] = (inputs, field_values(new, reads),
+                                   result.errors)
+        return result
+
+def fields_read(validator):
+    """
+    The names of the fields a form validator reads (see
+    `FormValidator.fields_read`), or None if that isn't known.
+    """
+    if isinstance(validator, type):
+        validator = validator.singleton()
+    method = getattr(validator, 'fields_read', None)
+    if method is None:
+        return None
+    names = method()
+    if names is None:
+        return None
+    return tuple(names)
+
+def fields_written(validator):
+    """
+    The names of the fields a form validator may change (see
+    `FormValidator.fields_written`), or None if that isn't known.
+    """
+    if isinstance(validator, type):
+        validator = validator.singleton()
+    method = getattr(validator, 'fields_written', None)
+    if method is None:
+        return fields_read(validator)
+    names = method()
+    if names is None:
+        return None
+    return tuple(names)
+
+def reads_any(names, fields):
+    """
+    True if any of ``names`` is in ``fields`` (or ``names`` is None,
+    i.e., unknown).
+    """
+    if names is None:
+        return True
+    for name in names:
+        if name in fields:
+            return True
+    return False
+
+def field_values(value_dict, names):
+    return tuple([value_dict.get(name, NoDefault) for name in names])
+
+def same_value(old, new):
+    """
+    True if ``new`` can be treated exactly like ``old``: it's the
+    same object, or equal and of the same type (tuples are compared
+    item by item).
+    """
+    if old is new:
+        return True
+    if type(old) is not type(new):
+        return False
+    if isinstance(old, tuple):
+        if len(old) != len(new):
+            return False
+        for old_item, new_item in zip(old, new):
+            if not same_value(old_item, new_item):
+                return False
+        return True
+    try:
+        return old == new
+    except Exception:
+        return False
+
+def partial_errors(validator, value_dict, state):
+    """
+    Runs ``validator.validate_partial``, returning the errors as a
+    dictionary, or None.
+    """
+    try:
+        validator.validate_partial(value_dict, state)
+    except Invalid, e:
+        sub_errors = e.unpack_errors()
+        if isinstance(sub_errors, dict):
+            return sub_errors
+        # Can't do anything here
+    return None
+
 def format_compound_error(v, indent=0):
     if isinstance(v, Exception):
         try:
@@ -334,6 +1109,10 @@ def format_compound_error(v, indent=0):
             ["%s: %s" % (k, format_compound_error(value, indent=len(k)+2))
              for k, value in l
              if value is not None])
+    elif isinstance(v, SparseErrorList):
+        return ('%s\n' % (' '*indent)).join(
+            ['%s' % (format_compound_error(value, indent=indent))
+             for index, value in v.items()])
     elif isinstance(v, list):
         return ('%s\n' % (' '*indent)).join(
             ['%s' % (format_compound_error(value, indent=indent))
@@ -356,8 +1135,8 @@ def merge_values(v1, v2):
     if (isinstance(v1, (str, unicode))
         and isinstance(v2, (str, unicode))):
         return v1 + '\n' + v2
-    elif (isinstance(v1, (list, tuple))
-          and isinstance(v2, (list, tuple))):
+    elif (isinstance(v1, (list, tuple, SparseErrorList))
+          and isinstance(v2, (list, tuple, SparseErrorList))):
         return merge_lists(v1, v2)
     elif isinstance(v1, dict) and isinstance(v2, dict):
         return merge_dicts(v1, v2)
@@ -366,6 +1145,9 @@ def merge_values(v1, v2):
         return v1
 
 def merge_lists(l1, l2):
+    if isinstance(l1, SparseErrorList) or isinstance(l2, SparseErrorList):
+        return merge_sparse_lists(SparseErrorList.from_list(l1),
+                                  SparseErrorList.from_list(l2))
     if len(l1) < len(l2):
         l1 = l1 + [None]*(len(l2)-len(l1))
     elif len(l2) < len(l1):
@@ -382,6 +1164,16 @@ def merge_lists(l1, l2):
         result.append(item)
     return result
 
+def merge_sparse_lists(l1, l2):
+    result = SparseErrorList(l1.by_index.copy(), max(len(l1), len(l2)))
+    by_index = result.by_index
+    for index, item in l2.by_index.items():
+        if by_index.has_key(index):
+            by_index[index] = merge_values(by_index[index], item)
+        else:
+            by_index[index] = item
+    return result
+
 class SimpleFormValidator(FancyValidator):
     """
     This validator wraps a simple function that validates the form.
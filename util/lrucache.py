@@ -0,0 +1,129 @@
+"""
+A small thread-safe LRU cache, with optional expiry.
+"""
+
+import time
+
+try:
+    import threading
+except ImportError:
+    threading = None
+
+class _DummyLock(object):
+
+    def acquire(self):
+        pass
+
+    def release(self):
+        pass
+
+# Positions in a link of the cache's doubly-linked list:
+PREV, NEXT, KEY, VALUE, EXPIRES = 0, 1, 2, 3, 4
+
+class LRUCache(object):
+
+    """
+    Maps keys to values, holding at most ``maxsize`` items; when it's
+    full, the least recently used item is dropped.  If ``ttl`` is
+    given, items also expire that many seconds after they were set.
+
+    ``hits`` and ``misses`` count the lookups.
+
+        >>> cache = LRUCache(2)
+        >>> cache.set('a', 1)
+        >>> cache.set('b', 2)
+        >>> cache.get('a')
+        1
+        >>> cache.set('c', 3)
+        >>> cache.get('b', 'gone')
+        'gone'
+        >>> len(cache), cache.hits, cache.misses
+        (2, 1, 1)
+    """
+
+    def __init__(self, maxsize=1000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = self.misses = 0
+        if threading is None:
+            self._lock = _DummyLock()
+        else:
+            self._lock = threading.Lock()
+        self._links = {}
+        # The root of a circular list, most recently used first:
+        self._root = root = []
+        root[:] = [root, root, None, None, None]
+
+    def get(self, key, default=None):
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            if link[EXPIRES] is not None and link[EXPIRES] < time.time():
+                self._unlink(link)
+                del self._links[key]
+                self.misses += 1
+                return default
+            self._unlink(link)
+            self._link_first(link)
+            self.hits += 1
+            return link[VALUE]
+        finally:
+            self._lock.release()
+
+    def set(self, key, value):
+        if self.ttl is None:
+            expires = None
+        else:
+            expires = time.time() + self.ttl
+        self._lock.acquire()
+        try:
+            link = self._links.get(key)
+            if link is not None:
+                self._unlink(link)
+                link[VALUE] = value
+                link[EXPIRES] = expires
+            else:
+                if len(self._links) >= self.maxsize:
+                    oldest = self._root[PREV]
+                    if oldest is self._root:
+                        # maxsize is 0
+                        return
+                    self._unlink(oldest)
+                    del self._links[oldest[KEY]]
+                link = [None, None, key, value, expires]
+                self._links[key] = link
+            self._link_first(link)
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        self._lock.acquire()
+        try:
+            self._links.clear()
+            root = self._root
+            root[PREV] = root[NEXT] = root
+            self.hits = self.misses = 0
+        finally:
+            self._lock.release()
+
+    def __len__(self):
+        return len(self._links)
+
+    def _unlink(self, link):
+        link[PREV][NEXT] = link[NEXT]
+        link[NEXT][PREV] = link[PREV]
+
+    def _link_first(self, link):
+        root = self._root
+        link[PREV] = root
+        link[NEXT] = root[NEXT]
+        root[NEXT][PREV] = link
+        root[NEXT] = link
+
+    def __repr__(self):
+        return '<%s %i/%i items, %i hits, %i misses>' % (
+            self.__class__.__name__, len(self), self.maxsize,
+            self.hits, self.misses)
@@ -149,6 +149,7 @@ class ConfirmType(FancyValidator):
 
     subclass = None
     type = None
+    pure = True
 
     messages = {
         'subclass': _("%(object)r is not a subclass of %(subclass)s"),
@@ -289,6 +290,8 @@ class Constant(FancyValidator):
         'X'
     """
 
+    pure = True
+
     __unpackargs__ = ('value',)
 
     def _to_python(self, value, state):
@@ -333,6 +336,8 @@ class MaxLength(FancyValidator):
         Invalid: Invalid value (value with length expected)
     """
 
+    pure = True
+
     __unpackargs__ = ('maxLength',)
     messages = {
         'tooLong': _("Enter a value less than %(maxLength)i characters long"),
@@ -343,13 +348,13 @@ class MaxLength(FancyValidator):
         try:
             if value and \
                len(value) > self.maxLength:
-                raise Invalid(self.message('tooLong', state,
-                                           maxLength=self.maxLength),
+                raise Invalid(self.lazy_message('tooLong', state,
+                                                maxLength=self.maxLength),
                               value, state)
             else:
                 return None
         except TypeError:
-            raise Invalid(self.message('invalid', state),
+            raise Invalid(self.lazy_message('invalid', state),
                           value, state)
 
 class MinLength(FancyValidator):
@@ -388,6 +393,8 @@ class MinLength(FancyValidator):
 
     """
 
+    pure = True
+
     __unpackargs__ = ('minLength',)
 
     messages = {
@@ -398,11 +405,11 @@ class MinLength(FancyValidator):
     def validate_python(self, value, state):
         try:
             if len(value) < self.minLength:
-                raise Invalid(self.message('tooShort', state,
-                                           minLength=self.minLength),
+                raise Invalid(self.lazy_message('tooShort', state,
+                                                minLength=self.minLength),
                               value, state)
         except TypeError:
-            raise Invalid(self.message('invalid', state),
+            raise Invalid(self.lazy_message('invalid', state),
                           value, state)
 
 class NotEmpty(FancyValidator):
@@ -424,6 +431,7 @@ class NotEmpty(FancyValidator):
         0
     """
     not_empty = True
+    pure = True
 
     messages = {
         'empty': _("Please enter a value"),
@@ -434,7 +442,7 @@ class NotEmpty(FancyValidator):
             # This isn't "empty" for this definition.
             return value
         if not value:
-            raise Invalid(self.message('empty', state),
+            raise Invalid(self.lazy_message('empty', state),
                           value, state)
 
 class Empty(FancyValidator):
@@ -450,13 +458,15 @@ class Empty(FancyValidator):
         Invalid: You cannot enter a value here
     """
 
+    pure = True
+
     messages = {
         'notEmpty': _("You cannot enter a value here"),
         }
 
     def validate_python(self, value, state):
         if value or value == 0:
-            raise Invalid(self.message('notEmpty', state),
+            raise Invalid(self.lazy_message('notEmpty', state),
                           value, state)
 
 class Regex(FancyValidator):
@@ -498,6 +508,7 @@ class Regex(FancyValidator):
     regexOps = ()
     strip = False
     regex = None
+    pure = True
 
     __unpackargs__ = ('regex',)
 
@@ -524,7 +535,7 @@ class Regex(FancyValidator):
         if self.strip and isinstance(value, basestring):
             value = value.strip()
         if not self.regex.search(value):
-            raise Invalid(self.message('invalid', state),
+            raise Invalid(self.lazy_message('invalid', state),
                           value, state)
 
     def _to_python(self, value, state):
@@ -592,6 +603,7 @@ class OneOf(FancyValidator):
     list = None
     testValueList = False
     hideList = False
+    pure = True
 
     __unpackargs__ = ('list',)
 
@@ -607,13 +619,13 @@ class OneOf(FancyValidator):
         else:
             if not value in self.list:
                 if self.hideList:
-                    raise Invalid(self.message('invalid', state),
+                    raise Invalid(self.lazy_message('invalid', state),
                                   value, state)
                 else:
                     items = '; '.join(map(str, self.list))
-                    raise Invalid(self.message('notIn', state,
-                                               items=items,
-                                               value=value),
+                    raise Invalid(self.lazy_message('notIn', state,
+                                                    items=items,
+                                                    value=value),
                                   value, state)
 
 class DictConverter(FancyValidator):
@@ -656,6 +668,7 @@ class DictConverter(FancyValidator):
 
     dict = None
     hideDict = False
+    pure = True
 
     __unpackargs__ = ('dict',)
 
@@ -720,6 +733,7 @@ class IndexListConverter(FancyValidator):
     """
 
     list = None
+    pure = True
 
     __unpackargs__ = ('list',)
 
@@ -892,6 +906,7 @@ class Bool(FancyValidator):
     """
 
     if_missing = False
+    pure = True
 
     def _to_python(self, value, state):
         return bool(value)
@@ -912,6 +927,8 @@ class RangeValidator(FancyValidator):
 
     """
 
+    pure = True
+
     messages = {
         'tooLow': _("Please enter a number that is %(min)s or greater"),
         'tooHigh': _("Please enter a number that is %(max)s or smaller"),
@@ -923,11 +940,11 @@ class RangeValidator(FancyValidator):
     def validate_python(self, value, state):
         if self.min is not None:
             if value < self.min:
-                msg = self.message("tooLow", state, min=self.min)
+                msg = self.lazy_message("tooLow", state, min=self.min)
                 raise Invalid(msg, value, state)
         if self.max is not None:
             if value > self.max:
-                msg = self.message("tooHigh", state, max=self.max)
+                msg = self.lazy_message("tooHigh", state, max=self.max)
                 raise Invalid(msg, value, state)
 
 
@@ -960,7 +977,7 @@ class Int(RangeValidator):
         try:
             return int(value)
         except (ValueError, TypeError):
-            raise Invalid(self.message('integer', state),
+            raise Invalid(self.lazy_message('integer', state),
                           value, state)
 
     _from_python = _to_python
@@ -1008,7 +1025,7 @@ class Number(RangeValidator):
                 return int_value
             return value
         except ValueError:
-            raise Invalid(self.message('number', state),
+            raise Invalid(self.lazy_message('number', state),
                           value, state)
 
 
@@ -1056,6 +1073,7 @@ class String(FancyValidator):
     not_empty = None
     encoding = None
     list_joiner = ', '
+    pure = True
 
     messages = {
         'tooLong': _("Enter a value less than %(max)i characters long"),
@@ -1098,13 +1116,13 @@ class String(FancyValidator):
     def validate_other(self, value, state):
         if (self.max is not None and value is not None
             and len(value) > self.max):
-            raise Invalid(self.message('tooLong', state,
-                                       max=self.max),
+            raise Invalid(self.lazy_message('tooLong', state,
+                                            max=self.max),
                           value, state)
         if (self.min is not None
             and (not value or len(value) < self.min)):
-            raise Invalid(self.message('tooShort', state,
-                                       min=self.min),
+            raise Invalid(self.lazy_message('tooShort', state,
+                                            min=self.min),
                           value, state)
 
     def empty_value(self, value):
@@ -1162,10 +1180,13 @@ class UnicodeString(String):
             try:
                 value = unicode(value, self.inputEncoding)
             except UnicodeDecodeError:
-                raise Invalid(self.message('badEncoding', state), value, state)
+                raise Invalid(self.lazy_message('badEncoding', state),
+                              value, state)
             except TypeError:
-                raise Invalid(self.message('badType', state, type=type(value),
-                    value=value), value, state)
+                raise Invalid(self.lazy_message('badType', state,
+                                                type=type(value),
+                                                value=value),
+                              value, state)
         return value
 
     def _from_python(self, value, state):
@@ -1300,6 +1321,13 @@ class Email(FancyValidator):
     """
 
     resolve_domain = False
+    # The cost (see `Validator.cost`) when resolve_domain is true:
+    network_cost = 100
+    # An explicit cost; by default it depends on resolve_domain:
+    _cost = None
+    # Explicitly pure or not; by default it's pure unless
+    # resolve_domain is true:
+    _pure = None
 
     usernameRE = re.compile(r"^[^ \t\n\r@<>()]+$", re.I)
     domainRE = re.compile(r'''
@@ -1327,10 +1355,32 @@ class Email(FancyValidator):
                     "I cannot resolve domain names in addresses")
                 raise ImportError, "no module named DNS"
 
+    def cost__get(self):
+        if self._cost is not None:
+            return self._cost
+        if self.resolve_domain:
+            return self.network_cost
+        return FancyValidator.cost
+
+    def cost__set(self, value):
+        self._cost = value
+
+    cost = property(cost__get, cost__set)
+
+    def pure__get(self):
+        if self._pure is not None:
+            return self._pure
+        return not self.resolve_domain
+
+    def pure__set(self, value):
+        self._pure = value
+
+    pure = property(pure__get, pure__set)
+
     def validate_python(self, value, state):
         if not value:
             raise Invalid(
-                self.message('empty', state),
+                self.lazy_message('empty', state),
                 value, state)
         value = value.strip()
         splitted = value.split('@', 1)
@@ -1338,17 +1388,17 @@ class Email(FancyValidator):
             username, domain=splitted
         except ValueError:
             raise Invalid(
-                self.message('noAt', state),
+                self.lazy_message('noAt', state),
                 value, state)
         if not self.usernameRE.search(username):
             raise Invalid(
-                self.message('badUsername', state,
-                             username=username),
+                self.lazy_message('badUsername', state,
+                                  username=username),
                 value, state)
         if not self.domainRE.search(domain):
             raise Invalid(
-                self.message('badDomain', state,
-                             domain=domain),
+                self.lazy_message('badDomain', state,
+                                  domain=domain),
                 value, state)
         if self.resolve_domain:
             assert have_dns, "pyDNS should be available"
@@ -1434,6 +1484,13 @@ class URL(FancyValidator):
     check_exists = False
     add_http = True
     require_tld = True
+    # The cost (see `Validator.cost`) when check_exists is true:
+    network_cost = 100
+    # An explicit cost; by default it depends on check_exists:
+    _cost = None
+    # Explicitly pure or not; by default it's pure unless
+    # check_exists is true:
+    _pure = None
 
     url_re = re.compile(r'''
         ^(http|https)://
@@ -1459,6 +1516,28 @@ class URL(FancyValidator):
         'noTLD': _('You must provide a full domain name (like %(domain)s.com)'),
         }
 
+    def cost__get(self):
+        if self._cost is not None:
+            return self._cost
+        if self.check_exists:
+            return self.network_cost
+        return FancyValidator.cost
+
+    def cost__set(self, value):
+        self._cost = value
+
+    cost = property(cost__get, cost__set)
+
+    def pure__get(self):
+        if self._pure is not None:
+            return self._pure
+        return not self.check_exists
+
+    def pure__set(self, value):
+        self._pure = value
+
+    pure = property(pure__get, pure__set)
+
     def _to_python(self, value, state):
         value = value.strip()
         if self.add_http:
@@ -1567,6 +1646,8 @@ class XRI(FancyValidator):
 
     """
 
+    pure = True
+
     iname_valid_pattern = re.compile(r"""
     ^
     [\w]+                  # A global alphanumeric i-name
@@ -1899,6 +1980,7 @@ class DateConverter(FancyValidator):
     # 'mxDateTime' to force the mxDateTime module (None means use
     # datetime, or if not present mxDateTime)
     datetime_module = None
+    pure = True
 
     _day_date_re = re.compile(r'^\s*(\d\d?)[\-\./\\](\d\d?|jan|january|feb|febuary|mar|march|apr|april|may|jun|june|jul|july|aug|august|sep|sept|september|oct|october|nov|november|dec|december)[\-\./\\](\d\d\d?\d?)\s*$', re.I)
     _month_date_re = re.compile(r'^\s*(\d\d?|jan|january|feb|febuary|mar|march|apr|april|may|jun|june|jul|july|aug|august|sep|sept|september|oct|october|nov|november|dec|december)[\-\./\\](\d\d\d?\d?)\s*$', re.I)
@@ -2114,6 +2196,7 @@ class TimeConverter(FancyValidator):
     prefer_ampm = False
     use_seconds = 'optional'
     use_datetime = False
+    pure = True
     # This can be set to make it prefer mxDateTime:
     datetime_module = None
 
@@ -2328,6 +2411,7 @@ class StringBool(FancyValidator):
 
     true_values = ['true', 't', 'yes', 'y', 'on', '1']
     false_values = ['false', 'f', 'no', 'n', 'off', '0']
+    pure = True
 
     messages = { "string" : _("Value should be %(true)r or %(false)r") }
 
@@ -2440,6 +2524,8 @@ class IPAddress(FancyValidator):
             ...
         Invalid: Please enter a valid IP address (a.b.c.d)
     """
+    pure = True
+
     messages = {
             'bad_format' : u'Please enter a valid IP address (a.b.c.d)',
             'illegal_octets' : u'The octets must be within the range of 0-255 (not %(octet)r)',
@@ -2534,6 +2620,7 @@ class MACAddress(FancyValidator):
     strip=True
     valid_characters = '0123456789abcdefABCDEF'
     add_colons = False
+    pure = True
 
     messages = {
         'bad_length': _(u'A MAC address must contain 12 digits and A-F; the value you gave has %(length)s characters'),
@@ -2585,6 +2672,23 @@ class FormValidator(FancyValidator):
     def is_empty(self, value):
         return False
 
+    def fields_read(self):
+        """
+        Returns the names of the fields this validator looks at, or
+        None if that isn't known.  Any field it changes must be among
+        them.  `Schema.revalidate` uses this to skip validators whose
+        fields haven't changed.
+        """
+        return None
+
+    def fields_written(self):
+        """
+        Returns the names of the fields this validator may change
+        (by default, the ones it reads), or None if that isn't known.
+        See `Schema.track_dependencies`.
+        """
+        return self.fields_read()
+
 class RequireIfMissing(FormValidator):
 
     """
@@ -2630,6 +2734,13 @@ class RequireIfMissing(FormValidator):
     present = None
     __unpackargs__ = ('required',)
 
+    def fields_read(self):
+        return [name for name in (self.required, self.missing, self.present)
+                if name]
+
+    def fields_written(self):
+        return []
+
     def _to_python(self, value_dict, state):
         is_required = False
         if self.missing and not value_dict.get(self.missing):
@@ -2679,6 +2790,12 @@ class FieldsMatch(FormValidator):
         if len(self.field_names) < 2:
             raise TypeError("FieldsMatch() requires at least two field names")
 
+    def fields_read(self):
+        return self.field_names
+
+    def fields_written(self):
+        return []
+
     def validate_partial(self, field_dict, state):
         for name in self.field_names:
             if not field_dict.has_key(name):
@@ -2754,6 +2871,12 @@ class CreditCardValidator(FormValidator):
         'missing_key': _("The field %(key)s is missing"),
         }
 
+    def fields_read(self):
+        return [self.cc_type_field, self.cc_number_field]
+
+    def fields_written(self):
+        return []
+
     def validate_partial(self, field_dict, state):
         if not field_dict.get(self.cc_type_field, None) \
            or not field_dict.get(self.cc_number_field, None):
@@ -2874,6 +2997,12 @@ class CreditCardExpires(FormValidator):
         'invalidNumber': _("Invalid Expiration Date"),
         }
 
+    def fields_read(self):
+        return [self.cc_expires_month_field, self.cc_expires_year_field]
+
+    def fields_written(self):
+        return []
+
     def validate_partial(self, field_dict, state):
         if not field_dict.get(self.cc_expires_month_field, None) \
            or not field_dict.get(self.cc_expires_year_field, None):
@@ -2944,6 +3073,12 @@ class CreditCardSecurityCode(FormValidator):
         'badLength': _("Invalid credit card security code length"),
         }
 
+    def fields_read(self):
+        return [self.cc_type_field, self.cc_code_field]
+
+    def fields_written(self):
+        return []
+
     def validate_partial(self, field_dict, state):
         if not field_dict.get(self.cc_type_field, None) \
            or not field_dict.get(self.cc_code_field, None):
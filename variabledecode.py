@@ -121,6 +121,18 @@ def variable_encode(d, prepend='', result=None, add_repetitions=True,
                 name = "%s%s%s" % (prepend, dict_char, key)
             variable_encode(value, name, result, add_repetitions,
                             dict_char=dict_char, list_char=list_char)
+    elif isinstance(d, api.SparseErrorList):
+        # Only the errors; the valid items would be None anyway:
+        for i, value in d.items():
+            variable_encode(value, "%s%s%i" % (prepend, list_char, i),
+                            result, add_repetitions,
+                            dict_char=dict_char, list_char=list_char)
+        if add_repetitions:
+            if prepend:
+                repName = '%s--repetitions' % prepend
+            else:
+                repName = '__repetitions__'
+            result[repName] = str(len(d))
     elif isinstance(d, list):
         for i in range(len(d)):
             variable_encode(d[i], "%s%s%i" % (prepend, list_char, i), result,